@@ -2,15 +2,32 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
-from typing import Union, List, Dict, Optional
+from typing import Union, List, Dict, Optional, Iterator, Callable, Any, ClassVar
 from decimal import Decimal
 from bsl.enums import Tokens, Keywords, Directives, PrepInstructions, PrepSymbols
-from bsl.visitor import Visitor
+from bsl.visitor import Visitor, kinds
 from abc import abstractmethod
 from collections import namedtuple
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+def unquote(lit: str) -> str:
+    return lit[1:-1].replace('""', '"')
+
+# Вычисление значения литерала по его тексту (см. BasicLitExpr.Value)
+literal_values: Dict[Union[Tokens, Keywords], Callable[[str], Any]] = {
+    Tokens.NUMBER: Decimal,
+    Tokens.STRING: unquote,
+    Tokens.STRINGBEG: unquote,
+    Tokens.STRINGMID: unquote,
+    Tokens.STRINGEND: unquote,
+}
 
 class Scope:
 
+    __slots__ = ('Outer', 'Vars', 'Auto', 'Methods')
+
     def __init__(self, outer: Optional['Scope'] = None):
         self.Outer: Optional['Scope'] = outer
         self.Vars: Dict[str, Item] = {}
@@ -22,6 +39,8 @@ class Item:
     Узел хранит информацию об объекте области видимости.
     Поле Decl хранит объявление данного объекта (None = объявление не обнаружено).
     """
+    __slots__ = ('Name', 'Decl')
+
     def __init__(self, name, decl=None):
         self.Name: str = name
         self.Decl: Optional[Decl] = decl
@@ -29,6 +48,8 @@ class Item:
 
 class Place:
 
+    __slots__ = ('BegPos', 'EndPos', 'BegLine', 'EndLine', 'BegColumn', 'EndColumn')
+
     def __init__(self, begpos, endpos, begline, endline, begcolumn, endcolumn):
         self.BegPos: int = begpos
         self.EndPos: int = endpos
@@ -37,8 +58,85 @@ class Place:
         self.BegColumn: int = begcolumn
         self.EndColumn: int = endcolumn
 
+class Lines:
+    """
+    Индекс начал строк модуля.
+    Переводит смещение в исходном тексте в номер строки и колонку.
+    """
+    __slots__ = ('Starts',)
+
+    def __init__(self, src):
+        starts = accumulate((len(line) + 1 for line in src.split('\n')), initial=0)
+        self.Starts = array('i', starts)
+        self.Starts.pop()  # последнее значение указывает за конец текста
+
+    def line(self, pos):
+        return bisect_right(self.Starts, pos)
+
+    def position(self, pos):
+        line = bisect_right(self.Starts, pos)
+        return line, pos - self.Starts[line-1]
+
+class LazyPlace:
+    """
+    Вариант Place, который хранит только смещения.
+    Строки и колонки вычисляются по индексу строк модуля при обращении.
+    Конец узла относится к строке последнего символа узла (как в Place).
+    """
+    __slots__ = ('BegPos', 'EndPos', 'Lines')
+
+    def __init__(self, begpos, endpos, lines):
+        self.BegPos: int = begpos
+        self.EndPos: int = endpos
+        self.Lines: Lines = lines
+
+    @property
+    def BegLine(self) -> int:
+        return self.Lines.line(self.BegPos)
+
+    @property
+    def EndLine(self) -> int:
+        return self.Lines.line(max(self.EndPos - 1, self.BegPos))
+
+    @property
+    def BegColumn(self) -> int:
+        return self.Lines.position(self.BegPos)[1]
+
+    @property
+    def EndColumn(self) -> int:
+        line = self.Lines.line(max(self.EndPos - 1, self.BegPos))
+        return self.EndPos - self.Lines.Starts[line-1]
+
+class Index:
+    """
+    Индекс узлов модуля (см. bsl.index.build): узлы по классам в порядке обхода визитером
+    и ссылки на родителей (у корня родитель None).
+    Плагины-запросы получают все узлы нужного класса без обхода дерева: index.of(ast.NewExpr).
+    """
+    __slots__ = ('Nodes', 'Parents')
+
+    def __init__(self, nodes, parents):
+        self.Nodes: Dict[type, List[Node]] = nodes
+        self.Parents: Dict[Node, Optional[Node]] = parents
+
+    def of(self, cls: type) -> List['Node']:
+        return self.Nodes.get(cls, [])
+
+    def parent(self, node: 'Node') -> Optional['Node']:
+        return self.Parents[node]
+
+    def ancestors(self, node: 'Node') -> Iterator['Node']:
+        """ родители узла от ближайшего к корню """
+        parents = self.Parents
+        parent = parents[node]
+        while parent is not None:
+            yield parent
+            parent = parents[parent]
+
 class Comment:
 
+    __slots__ = ('text', 'pos', 'line', 'column')
+
     def __init__(self, text, pos, line, column):
         self.text = text
         self.pos = pos
@@ -47,6 +145,10 @@ class Comment:
 
 class Node:
 
+    __slots__ = ()
+
+    KindId: ClassVar[int]  # номер вида узла (задается в конце модуля)
+
     @abstractmethod
     def visit(self, vesitor: Visitor):
         pass
@@ -55,13 +157,19 @@ class Node:
 class Module(Node):
     """
     Корень AST. Узел хранит информацию о модуле в целом.
+    Поле Scope хранит область видимости модуля (нужна для повторного разбора отдельных методов).
+    Поле Index хранит индекс узлов, если он строился при разборе (см. Parser, параметр node_index).
     """
-    def __init__(self, decls, auto, statements, interface, comments):
+    __slots__ = ('Decls', 'Auto', 'Body', 'Interface', 'Comments', 'Scope', 'Index')
+
+    def __init__(self, decls, auto, statements, interface, comments, scope=None, index=None):
         self.Decls: List[Decl] = decls
         self.Auto: List[AutoDecl] = auto
         self.Body: List[Stmt] = statements
         self.Interface: List[Item] = interface
         self.Comments: Dict[int, Comment] = comments
+        self.Scope: Optional[Scope] = scope
+        self.Index: Optional[Index] = index
 
     def visit(self, visitor: Visitor):
         visitor.visit_Module(self)
@@ -71,6 +179,9 @@ class Module(Node):
             auto.visit(visitor)
         for stmt in self.Body:
             stmt.visit(visitor)
+        comments = self.Comments
+        for line in sorted(comments):
+            visitor.visit_Comment(comments[line])
         visitor.leave_Module(self)
 
 Env = namedtuple('Env', [
@@ -92,12 +203,15 @@ Env = namedtuple('Env', [
 
 
 class Decl(Node):
+    __slots__ = ()
     Place: Place
 
 class GlobalObject(Decl):
     """
     Хранит информацию об объекте глобального контекста
     """
+    __slots__ = ('Name', 'Env', 'Attribs', 'Methods', 'Place')
+
     def __init__(self, name, env, attribs=None, methods=None):
         self.Name: str = name
         self.Env: Env = env
@@ -112,6 +226,8 @@ class GlobalMethodParameter(Decl):
     """
     Хранит информацию о параметре метода глобального контекста
     """
+    __slots__ = ('Name', 'Required', 'Place')
+
     def __init__(self, name, required):
         self.Name: str = name
         self.Required: bool = required
@@ -124,6 +240,8 @@ class GlobalMethod(Decl):
     """
     Хранит информацию о методе глобального контекста
     """
+    __slots__ = ('Name', 'Env', 'Params', 'RetVal', 'Place')
+
     def __init__(self, name, retval, params, env):
         self.Name: str = name
         self.Env: Env = env
@@ -143,6 +261,8 @@ class VarModListDecl(Decl):
     Перем П1 Экспорт, П2; // поле "List"
     </pre>
     """
+    __slots__ = ('Directive', 'List', 'Place')
+
     def __init__(self, directive, varlist, place):
         self.Directive: Optional[Directives] = directive
         self.List: List[VarModDecl] = varlist
@@ -165,6 +285,8 @@ class VarModDecl(Decl):
     Перем <П1 Экспорт>, <П2>;
     </pre>
     """
+    __slots__ = ('Name', 'Directive', 'Export', 'Place')
+
     def __init__(self, name, directive, export, place):
         self.Name: str = name
         self.Directive: Optional[Directives] = directive
@@ -184,6 +306,8 @@ class VarLocDecl(Decl):
     Перем <П1>, <П2>;
     </pre>
     """
+    __slots__ = ('Name', 'Place')
+
     def __init__(self, name, place):
         self.Name: str = name
         self.Place: Place = place
@@ -208,6 +332,8 @@ class AutoDecl(Decl):
         КонецЦикла;
     КонецЦикла
     """
+    __slots__ = ('Name', 'Place')
+
     def __init__(self, name, place):
         self.Name: str = name
         self.Place: Place = place
@@ -225,6 +351,8 @@ class ParamDecl(Decl):
     Процедура(<П1>, <Знач П2 = Неопределено>)
     </pre>
     """
+    __slots__ = ('Name', 'ByVal', 'Value', 'Place')
+
     def __init__(self, name, byval, value, place):
         self.Name: str = name
         self.ByVal: bool = byval
@@ -254,6 +382,8 @@ class MethodDecl(Decl):
     КонецФункции
     </pre>
     """
+    __slots__ = ('Sign', 'Vars', 'Auto', 'Body', 'Place')
+
     def __init__(self, sign, decls, auto, body, place):
         self.Sign: Union[ProcSign, FuncSign] = sign
         self.Vars: List[VarLocDecl] = decls
@@ -282,6 +412,8 @@ class ProcSign(Decl):
     Процедура Тест(П1, П2) Экспорт
     </pre>
     """
+    __slots__ = ('Name', 'Directive', 'Params', 'Export', 'Place')
+
     def __init__(self, name, directive, params, export, place):
         self.Name: str = name
         self.Directive: Directives = directive
@@ -304,6 +436,8 @@ class FuncSign(Decl):
     Функция Тест(П1, П2) Экспорт
     </pre>
     """
+    __slots__ = ('Name', 'Directive', 'Params', 'Export', 'Place')
+
     def __init__(self, name, directive, params, export, place):
         self.Name: str = name
         self.Directive: Directives = directive
@@ -324,6 +458,7 @@ class FuncSign(Decl):
 
 
 class Expr(Node):
+    __slots__ = ()
     Place: Place
 
 
@@ -336,11 +471,29 @@ Args = List[Optional[Expr]]
 class BasicLitExpr(Expr):
     """
     Хранит информацию о литерале примитивного типа.
+    Поле Lit хранит текст литерала. Значение чисел и строк (Value) вычисляется
+    по тексту при первом обращении и запоминается.
     """
-    def __init__(self, kind, value, place):
+    __slots__ = ('Kind', 'Lit', 'Place', '_value')
+
+    def __init__(self, kind, value, place, lit=None):
         self.Kind: Tokens = kind
-        self.Value: Union[str, bool, Decimal, None] = value  # TODO: date, null
+        self.Lit: Optional[str] = lit
         self.Place: Place = place
+        self._value: Union[str, bool, Decimal, None] = value  # TODO: date, null
+
+    @property
+    def Value(self) -> Union[str, bool, Decimal, None]:
+        value = self._value
+        if value is None and self.Lit is not None:
+            decode = literal_values.get(self.Kind)
+            if decode is not None:
+                value = self._value = decode(self.Lit)
+        return value
+
+    @Value.setter
+    def Value(self, value: Union[str, bool, Decimal, None]):
+        self._value = value
 
     def visit(self, visitor: Visitor):
         visitor.visit_BasicLitExpr(self)
@@ -351,6 +504,7 @@ class TailItemExpr(Expr):
     Базовый класс для элементов хвоста.
     Подклассы: FieldExpr и IndexExpr
     """
+    __slots__ = ()
 
 
 class FieldExpr(TailItemExpr):
@@ -365,6 +519,8 @@ class FieldExpr(TailItemExpr):
     Значение = Объект<.Добавить(П1, П2)>
     </pre>
     """
+    __slots__ = ('Name', 'Args', 'Place')
+
     def __init__(self, name, args, place):
         self.Name: str = name
         self.Args: Optional[Args] = args
@@ -387,6 +543,8 @@ class IndexExpr(TailItemExpr):
     Значение = Объект<[Ключ]>
     </pre>
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: Expr = expr
         self.Place: Place = place
@@ -411,6 +569,8 @@ class IdentExpr(Expr):
     Возврат <Запрос.Выполнить().Выгрузить()[0]>;
     </pre>
     """
+    __slots__ = ('Head', 'Args', 'Tail', 'Place')
+
     def __init__(self, item, tail, args, place):
         self.Head: Item = item
         self.Args: Optional[Args] = args
@@ -441,6 +601,8 @@ class UnaryExpr(Expr):
     Значение = <-(Сумма1 + Сумма2)> / 2;
     </pre>
     """
+    __slots__ = ('Operator', 'Operand', 'Place')
+
     def __init__(self, operator, operand, place):
         self.Operator: Tokens = operator
         self.Operand: Expr = operand
@@ -467,6 +629,8 @@ class BinaryExpr(Expr):
     КонецЕсли;
     </pre>
     """
+    __slots__ = ('Left', 'Operator', 'Right', 'Place')
+
     def __init__(self, left, operator, right, place):
         self.Left: Expr = left
         self.Operator: Tokens = operator
@@ -474,10 +638,18 @@ class BinaryExpr(Expr):
         self.Place: Place = place
 
     def visit(self, visitor: Visitor):
-        visitor.visit_BinaryExpr(self)
-        self.Left.visit(visitor)
-        self.Right.visit(visitor)
-        visitor.leave_BinaryExpr(self)
+        # обход без рекурсии по левой ветви: длинные цепочки вида А + Б + В + ...
+        # дают глубокие левосторонние деревья
+        chain = []
+        node: Expr = self
+        while type(node) is BinaryExpr:
+            visitor.visit_BinaryExpr(node)
+            chain.append(node)
+            node = node.Left
+        node.visit(visitor)
+        for node in reversed(chain):
+            node.Right.visit(visitor)
+            visitor.leave_BinaryExpr(node)
 
 class NewExpr(Expr):
     """
@@ -494,6 +666,8 @@ class NewExpr(Expr):
     Массив = <Новый (Тип("Массив"), Параметры)>;
     </pre>
     """
+    __slots__ = ('Name', 'Args', 'Place')
+
     def __init__(self, name, args, place):
         self.Name: Optional[str] = name
         self.Args: Args = args
@@ -517,6 +691,8 @@ class TernaryExpr(Expr):
     ).Количество();      // поле "Tail"
     </pre>
     """
+    __slots__ = ('Cond', 'Then', 'Else', 'Tail', 'Place')
+
     def __init__(self, cond, thenpart, elsepart, tail, place):
         self.Cond: Expr = cond
         self.Then: Expr = thenpart
@@ -542,6 +718,8 @@ class ParenExpr(Expr):
     Сумма = <(Сумма1 + Сумма2)> * Количество;
     </pre>
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: Expr = expr
         self.Place: Place = place
@@ -561,6 +739,8 @@ class NotExpr(Expr):
     НеРавны = <Не Сумма1 = Сумма2>;
     </pre>
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: Expr = expr
         self.Place: Place = place
@@ -586,6 +766,8 @@ class StringExpr(Expr):
     "еще часть";                 // Nodes.String
     </pre>
     """
+    __slots__ = ('List', 'Place')
+
     def __init__(self, exprlist, place):
         self.List: List[BasicLitExpr] = exprlist
         self.Place: Place = place
@@ -604,6 +786,7 @@ class StringExpr(Expr):
 
 
 class Stmt(Node):
+    __slots__ = ()
     Place: Place
 
 
@@ -611,6 +794,8 @@ class AssignStmt(Stmt):
     """
     Хранит оператор присваивания.
     """
+    __slots__ = ('Left', 'Right', 'Place')
+
     def __init__(self, left, right, place):
         self.Left: IdentExpr = left
         self.Right: Expr = right
@@ -636,6 +821,8 @@ class ReturnStmt(Stmt):
     Хранит оператор "Возврат".
     Поле "Expr" равно Неопределено если это возврат из процедуры.
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: Optional[Expr] = expr
         self.Place: Place = place
@@ -656,6 +843,8 @@ class BreakStmt(Stmt):
     """
     Хранит оператор "Прервать".
     """
+    __slots__ = ('Place',)
+
     def __init__(self, place):
         self.Place: Place = place
 
@@ -667,6 +856,8 @@ class ContinueStmt(Stmt):
     """
     Хранит оператор "Продолжить".
     """
+    __slots__ = ('Place',)
+
     def __init__(self, place):
         self.Place: Place = place
 
@@ -679,6 +870,8 @@ class RaiseStmt(Stmt):
     Хранит оператор "ВызватьИсключение".
     Поле "Expr" равно Неопределено если это вариант оператора без выражения.
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: Optional[Expr] = expr
         self.Place: Place = place
@@ -699,6 +892,8 @@ class ExecuteStmt(Stmt):
     """
     Хранит оператор "Выполнить".
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: Expr = expr
         self.Place: Place = place
@@ -718,6 +913,8 @@ class CallStmt(Stmt):
     """
     Хранит вызов процедуры или функции как процедуры.
     """
+    __slots__ = ('Ident', 'Place')
+
     def __init__(self, identexpr, place):
         self.Ident: IdentExpr = identexpr
         self.Place: Place = place
@@ -749,6 +946,8 @@ class IfStmt(Stmt):
     Поля "ElsIf" и "Else" равны Неопределено если
     соответствующие блоки отсутствуют в исходном коде.
     """
+    __slots__ = ('Cond', 'Then', 'ElsIf', 'Else', 'Place')
+
     def __init__(self, cond, thenpart, elsifpart, elsepart, place):
         self.Cond: Expr = cond
         self.Then: List[Stmt] = thenpart
@@ -781,6 +980,8 @@ class ElseStmt(Stmt):
     """
     Хранит блок "Иначе"
     """
+    __slots__ = ('Body', 'Place')
+
     def __init__(self, body, place):
         self.Body: List[Stmt] = body
         self.Place: Place = place
@@ -803,6 +1004,8 @@ class ElsIfStmt(Stmt):
     ...
     </pre>
     """
+    __slots__ = ('Cond', 'Then', 'Place')
+
     def __init__(self, cond, then, place):
         self.Cond: Expr = cond
         self.Then: List[Stmt] = then
@@ -832,6 +1035,8 @@ class WhileStmt(Stmt):
     КонецЦикла
     </pre>
     """
+    __slots__ = ('Cond', 'Body', 'Place')
+
     def __init__(self, cond, body, place):
         self.Cond: Expr = cond
         self.Body: List[Stmt] = body
@@ -862,6 +1067,8 @@ class ForStmt(Stmt):
     КонецЦикла
     </pre>
     """
+    __slots__ = ('Ident', 'From', 'To', 'Body', 'Place')
+
     def __init__(self, ident, fromexpr, toexpr, body, place):
         self.Ident: IdentExpr = ident
         self.From: Expr = fromexpr
@@ -902,6 +1109,8 @@ class ForEachStmt(Stmt):
     КонецЦикла
     </pre>
     """
+    __slots__ = ('Ident', 'In', 'Body', 'Place')
+
     def __init__(self, identexpr, collection, body, place):
         self.Ident: IdentExpr = identexpr
         self.In: Expr = collection
@@ -938,6 +1147,8 @@ class TryStmt(Stmt):
     КонецПопытки
     </pre>
     """
+    __slots__ = ('Try', 'Except', 'Place')
+
     def __init__(self, trypart, exceptpart, place):
         self.Try: List[Stmt] = trypart
         self.Except: ExceptStmt = exceptpart
@@ -955,6 +1166,8 @@ class ExceptStmt(Stmt):
     """
     Хранит блок "Исключение".
     """
+    __slots__ = ('Body', 'Place')
+
     def __init__(self, body, place):
         self.Body: List[Stmt] = body
         self.Place: Place = place
@@ -970,6 +1183,8 @@ class GotoStmt(Stmt):
     """
     Хранит оператор "Перейти".
     """
+    __slots__ = ('Label', 'Place')
+
     def __init__(self, label, place):
         self.Label: str = label
         self.Place: Place = place
@@ -982,6 +1197,8 @@ class LabelStmt(Stmt):
     """
     Хранит оператор метки.
     """
+    __slots__ = ('Label', 'Place')
+
     def __init__(self, label, place):
         self.Label: str = label
         self.Place: Place = place
@@ -997,6 +1214,7 @@ class LabelStmt(Stmt):
 
 
 class PrepInst(Decl, Stmt):
+    __slots__ = ()
     Place: Place
 
 
@@ -1010,6 +1228,8 @@ class PrepIfInst(PrepInst):
     ...
     </pre>
     """
+    __slots__ = ('Cond', 'Place')
+
     def __init__(self, cond, place):
         self.Cond: PrepExpr = cond
         self.Place: Place = place
@@ -1035,6 +1255,8 @@ class PrepElsIfInst(PrepInst):
     ...
     </pre>
     """
+    __slots__ = ('Cond', 'Place')
+
     def __init__(self, cond, place):
         self.Cond: PrepExpr = cond
         self.Place: Place = place
@@ -1054,6 +1276,8 @@ class PrepElseInst(PrepInst):
     """
     Хранит информацию об инструкции препроцессора #Иначе
     """
+    __slots__ = ('Place',)
+
     def __init__(self, place):
         self.Place: Place = place
 
@@ -1065,6 +1289,8 @@ class PrepEndIfInst(PrepInst):
     """
     Хранит информацию об инструкции препроцессора #КонецЕсли
     """
+    __slots__ = ('Place',)
+
     def __init__(self, place):
         self.Place: Place = place
 
@@ -1082,6 +1308,8 @@ class PrepRegionInst(PrepInst):
     ...
     </pre>
     """
+    __slots__ = ('Name', 'Place')
+
     def __init__(self, name, place):
         self.Name: str = name
         self.Place: Place = place
@@ -1100,6 +1328,8 @@ class PrepEndRegionInst(PrepInst):
     ...
     </pre>
     """
+    __slots__ = ('Place',)
+
     def __init__(self, place):
         self.Place = place
 
@@ -1113,6 +1343,7 @@ class PrepEndRegionInst(PrepInst):
 
 
 class PrepExpr(Node):
+    __slots__ = ()
     Place: Place
 
 
@@ -1128,6 +1359,8 @@ class PrepBinaryExpr(PrepExpr):
     ...
     </pre>
     """
+    __slots__ = ('Left', 'Operator', 'Right', 'Place')
+
     def __init__(self, left, operator, right, place):
         self.Left: PrepExpr = left
         self.Operator: Tokens = operator
@@ -1151,6 +1384,8 @@ class PrepNotExpr(PrepExpr):
     ...
     </pre>
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: PrepExpr = expr
         self.Place: Place = place
@@ -1171,6 +1406,8 @@ class PrepSymExpr(PrepExpr):
     #Если <Сервер> Тогда
     </pre>
     """
+    __slots__ = ('Symbol', 'Exist', 'Place')
+
     def __init__(self, symbol, exist, place):
         self.Symbol: str = symbol
         self.Exist: bool = exist
@@ -1189,6 +1426,8 @@ class PrepParenExpr(PrepExpr):
     #Если <(Сервер Или ВнешнееСоединение)> Тогда
     </pre>
     """
+    __slots__ = ('Expr', 'Place')
+
     def __init__(self, expr, place):
         self.Expr: PrepExpr = expr
         self.Place: Place = place
@@ -1199,4 +1438,8 @@ class PrepParenExpr(PrepExpr):
         visitor.leave_PrepParenExpr(self)
 
 
-#endregion PrepExpr
\ No newline at end of file
+#endregion PrepExpr
+# Номера видов узлов (индексы счетчиков визитера, см. bsl.visitor.kinds)
+for kind_id, kind in enumerate(kinds):
+    globals()[kind].KindId = kind_id
+del kind_id, kind
@@ -0,0 +1,309 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Двоичное представление разобранного модуля (для кеша AST, см. bsl.cache).
+
+Узел кодируется кортежем (KindId, поля в порядке __slots__ без Place, место),
+потомки - вложенными кортежами, цепочка BinaryExpr по левой ветви - одним плоским кортежем.
+Место - кортеж (BegPos, EndPos) для ast.LazyPlace и все шесть полей для ast.Place:
+у части узлов строки и колонки не выводятся из смещений, поэтому деревья, разобранные
+с lazy_places и без, кодируются по-разному.
+Результат сериализуется модулем marshal и сжимается zlib.
+
+Элементы областей видимости (Item) кодируются номерами в таблице элементов модуля.
+Элементы внешних областей (глобальной, конфигурации и т.п.) не сохраняются:
+в таблицу попадает их адрес (глубина области, словарь, ключ), и при чтении они берутся
+из переданной области видимости. Объявления, на которые ссылаются элементы (Decl),
+нумеруются в порядке кодирования.
+"""
+
+from typing import List, Dict, Tuple, Optional, Any, Callable, Union
+from enum import Enum
+import marshal
+import gc
+import zlib
+from bsl.enums import Tokens, Keywords, Directives
+import bsl.ast as ast
+import bsl.fused as fused
+
+# версия формата (входит в ключ кеша)
+FORMAT = 1
+
+class Unsupported(Exception):
+    """ модуль нельзя закодировать (например, элемент ссылается на объявление вне модуля) """
+
+# Коды перечислений: индексы в enums
+enums: List[Enum] = [*Tokens, *Keywords, *Directives]
+enum_codes: Dict[Enum, int] = {member: code for code, member in enumerate(enums)}
+
+# Поля-перечисления и поля-элементы; остальные поля, кроме потомков, хранятся как есть
+enum_fields = {
+    ('BasicLitExpr', 'Kind'), ('UnaryExpr', 'Operator'), ('BinaryExpr', 'Operator'), ('PrepBinaryExpr', 'Operator'),
+    ('VarModListDecl', 'Directive'), ('VarModDecl', 'Directive'), ('ProcSign', 'Directive'), ('FuncSign', 'Directive'),
+}
+item_fields = {('IdentExpr', 'Head')}
+
+# Объявления, на которые могут ссылаться элементы областей видимости
+decl_types = ('AutoDecl', 'ParamDecl', 'VarLocDecl', 'VarModDecl', 'ProcSign', 'FuncSign')
+
+def slots(node_type: str) -> List[Tuple[str, str]]:
+    """ поля узла без Place в виде (вид, имя): вид потомка из bsl.fused.schema, enum, item, value или raw """
+    children = {name: kind for kind, name, category in fused.fields(node_type)}
+    result = []
+    for name in getattr(ast, node_type).__slots__:
+        if name == 'Place':
+            continue
+        if name in children:
+            kind = children[name]
+        elif (node_type, name) in enum_fields:
+            kind = 'enum'
+        elif (node_type, name) in item_fields:
+            kind = 'item'
+        elif name == '_value':
+            kind = 'value'
+        else:
+            kind = 'raw'
+        result.append((kind, name))
+    return result
+
+def generate() -> str:
+    """
+    Генерирует исходный текст функций make_encoder(decls, item, value, place) и make_decoder(decls, items, place),
+    которые возвращают таблицы функций кодирования (по типу узла) и декодирования (по KindId).
+    """
+    lines = ['def make_encoder(decls, item, value, place):']
+    for node_type in fused.schema:
+        lines.append(f'    def e_{node_type}(n):')
+        if node_type == 'BinaryExpr':
+            lines.append('        chain = []')
+            lines.append('        while type(n) is BinaryExpr:')
+            lines.append('            chain.append(n)')
+            lines.append('            n = n.Left')
+            lines.append('        return (BinaryExpr.KindId, E[type(n)](n), tuple([')
+            lines.append('            (enum_codes[n.Operator], E[type(n.Right)](n.Right), place(n.Place))')
+            lines.append('            for n in reversed(chain)')
+            lines.append('        ]))')
+            continue
+        if node_type in decl_types:
+            lines.append('        decls[id(n)] = len(decls)')
+        values = [f'{node_type}.KindId']
+        for kind, name in slots(node_type):
+            x = f'n.{name}'
+            if kind in ('node', 'expr', 'prep'):
+                values.append(f'E[type({x})]({x})')
+            elif kind in ('node?', 'expr?'):
+                values.append(f'None if {x} is None else E[type({x})]({x})')
+            elif kind == 'list':
+                values.append(f'tuple([E[type(x)](x) for x in {x}])')
+            elif kind in ('list?', 'args', 'items'):
+                values.append(f'None if {x} is None else tuple([None if x is None else E[type(x)](x) for x in {x}])')
+            elif kind == 'enum':
+                values.append(f'None if {x} is None else enum_codes[{x}]')
+            elif kind == 'item':
+                values.append(f'item({x})')
+            elif kind == 'value':
+                values.append('value(n)')
+            else:
+                values.append(x)
+        values.append('place(n.Place)')
+        lines.append(f'        return ({", ".join(values)})')
+    lines.append('    E = {}')
+    for node_type in fused.schema:
+        lines.append(f'    E[{node_type}] = e_{node_type}')
+    lines.append('    return E')
+
+    lines.append('def make_decoder(decls, items, place):')
+    lines.append('    decl = decls.append')
+    for node_type in fused.schema:
+        lines.append(f'    def d_{node_type}(t):')
+        if node_type == 'BinaryExpr':
+            lines.append('        x = t[1]')
+            lines.append('        left = D[x[0]](x)')
+            lines.append('        for operator, x, p in t[2]:')
+            lines.append('            n = new(BinaryExpr)')
+            lines.append('            n.Left = left')
+            lines.append('            n.Operator = enums[operator]')
+            lines.append('            n.Right = D[x[0]](x)')
+            lines.append('            n.Place = place(*p)')
+            lines.append('            left = n')
+            lines.append('        return left')
+            continue
+        lines.append(f'        n = new({node_type})')
+        if node_type in decl_types:
+            lines.append('        decl(n)')
+        fields = slots(node_type)
+        for position, (kind, name) in enumerate(fields, 1):
+            if kind in ('node', 'expr', 'prep'):
+                lines.append(f'        x = t[{position}]')
+                lines.append(f'        n.{name} = D[x[0]](x)')
+            elif kind in ('node?', 'expr?'):
+                lines.append(f'        x = t[{position}]')
+                lines.append(f'        n.{name} = None if x is None else D[x[0]](x)')
+            elif kind == 'list':
+                lines.append(f'        n.{name} = [D[x[0]](x) for x in t[{position}]]')
+            elif kind in ('list?', 'args', 'items'):
+                lines.append(f'        xs = t[{position}]')
+                lines.append(f'        n.{name} = None if xs is None else [None if x is None else D[x[0]](x) for x in xs]')
+            elif kind == 'enum':
+                lines.append(f'        x = t[{position}]')
+                lines.append(f'        n.{name} = None if x is None else enums[x]')
+            elif kind == 'item':
+                lines.append(f'        x = t[{position}]')
+                lines.append(f'        n.{name} = None if x is None else items[x]')
+            else:
+                lines.append(f'        n.{name} = t[{position}]')
+        lines.append(f'        n.Place = place(*t[{len(fields) + 1}])')
+        lines.append('        return n')
+    lines.append(f'    D = [None] * {len(fused.schema) + 2}')
+    for node_type in fused.schema:
+        lines.append(f'    D[{node_type}.KindId] = d_{node_type}')
+    lines.append('    return D')
+    return '\n'.join(lines) + '\n'
+
+namespace: Dict[str, Any] = {name: getattr(ast, name) for name in fused.schema}
+namespace['enums'] = enums
+namespace['enum_codes'] = enum_codes
+namespace['new'] = object.__new__
+exec(compile(generate(), '<binary>', 'exec'), namespace)
+make_encoder = namespace['make_encoder']
+make_decoder = namespace['make_decoder']
+
+def external_items(scope: Optional[ast.Scope]) -> Dict[int, Tuple[int, str, str]]:
+    """ адреса элементов внешних областей: id элемента -> (глубина области, 'v' или 'm', ключ) """
+    result: Dict[int, Tuple[int, str, str]] = {}
+    depth = 0
+    while scope is not None:
+        for kind, table in ('v', scope.Vars), ('m', scope.Methods):
+            for key, item in table.items():
+                result.setdefault(id(item), (depth, kind, key))
+        scope = scope.Outer
+        depth += 1
+    return result
+
+def encode(module: ast.Module, errors: List[Tuple[str, int, int]], lazy_places: bool) -> bytes:
+    """ кодирует модуль, разобранный с lazy_places или без, вместе с ошибками разбора (кортежи text, pos, line) """
+    decls: Dict[int, int] = {}
+    items: Dict[int, int] = {}
+    table: List[ast.Item] = []
+    scope = module.Scope
+    assert scope is not None
+    externals = external_items(scope.Outer)
+
+    def item(x: ast.Item) -> int:
+        number = items.get(id(x))
+        if number is None:
+            number = items[id(x)] = len(table)
+            table.append(x)
+        return number
+
+    def value(n: ast.BasicLitExpr):
+        x = n._value
+        if x is None or type(x) in (str, bool):
+            return x
+        if n.Lit is None:
+            raise Unsupported(f'literal value {x!r}')
+        return None  # вычисляется по Lit при обращении
+
+    place: Callable[[Any], tuple]
+    if lazy_places:
+        place = lambda p: (p.BegPos, p.EndPos)
+    else:
+        place = lambda p: (p.BegPos, p.EndPos, p.BegLine, p.EndLine, p.BegColumn, p.EndColumn)
+
+    E = make_encoder(decls, item, value, place)
+    nodes = lambda xs: tuple([E[type(x)](x) for x in xs])
+    enabled = gc.isenabled()
+    gc.disable()  # см. decode
+    try:
+        body = (nodes(module.Decls), nodes(module.Auto), nodes(module.Body))
+    finally:
+        if enabled:
+            gc.enable()
+    interface = tuple([item(x) for x in module.Interface])
+    scope_vars = tuple([(key, item(x)) for key, x in scope.Vars.items()])
+    scope_methods = tuple([(key, item(x)) for key, x in scope.Methods.items()])
+    scope_auto = tuple([decls[id(x)] for x in scope.Auto])
+
+    entries: List[Union[Tuple[int, str, str], Tuple[str, Optional[int]]]] = []
+    for x in table:
+        address = externals.get(id(x))
+        if address is not None:
+            entries.append(address)
+        elif x.Decl is None:
+            entries.append((x.Name, None))
+        elif id(x.Decl) in decls:
+            entries.append((x.Name, decls[id(x.Decl)]))
+        else:
+            raise Unsupported(f'declaration of {x.Name} is outside of the module')
+
+    comments = tuple([(line, c.text, c.pos, c.line, c.column) for line, c in module.Comments.items()])
+    data = (FORMAT, lazy_places, body, interface, scope_vars, scope_methods, scope_auto, tuple(entries), comments, tuple(errors))
+    return zlib.compress(marshal.dumps(data), 1)
+
+def decode(data: bytes, scope: Optional[ast.Scope], lines: Optional[ast.Lines]) -> Tuple[ast.Module, list]:
+    """
+    Восстанавливает модуль, разобранный в области видимости scope (с тем же отпечатком, см. bsl.cache),
+    и ошибки разбора. Для модуля, разобранного с lazy_places, нужен индекс строк lines.
+    KeyError, если во внешних областях нет нужного элемента.
+    """
+    # дерево не содержит циклов, а сборщик мусора на сотнях тысяч новых объектов
+    # срабатывает многократно и занимает больше времени, чем само построение
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return load(marshal.loads(zlib.decompress(data)), scope, lines)
+    finally:
+        if enabled:
+            gc.enable()
+
+def load(fields: tuple, scope: Optional[ast.Scope], lines: Optional[ast.Lines]) -> Tuple[ast.Module, list]:
+    if fields[0] != FORMAT:
+        raise ValueError(f'unknown format {fields[0]}')
+    fmt, lazy_places, body, interface, scope_vars, scope_methods, scope_auto, entries, comments, errors = fields
+
+    items: List[ast.Item] = []
+    patches = []
+    for entry in entries:
+        if len(entry) == 3:
+            depth, kind, key = entry
+            outer = scope
+            for _ in range(depth):
+                assert outer is not None
+                outer = outer.Outer
+            assert outer is not None
+            items.append((outer.Vars if kind == 'v' else outer.Methods)[key])
+        else:
+            name, number = entry
+            x = ast.Item(name)
+            if number is not None:
+                patches.append((x, number))
+            items.append(x)
+
+    make_place: Callable[..., Any]
+    if lazy_places:
+        LazyPlace = ast.LazyPlace
+        make_place = lambda beg, end: LazyPlace(beg, end, lines)
+    else:
+        make_place = ast.Place
+
+    decls: List[ast.Node] = []
+    D = make_decoder(decls, items, make_place)
+    decls_body, auto, statements = [[D[x[0]](x) for x in xs] for xs in body]
+    for x, number in patches:
+        x.Decl = decls[number]
+
+    module_scope = ast.Scope(scope)
+    module_scope.Vars = {key: items[number] for key, number in scope_vars}
+    module_scope.Methods = {key: items[number] for key, number in scope_methods}
+    module_scope.Auto = [decls[number] for number in scope_auto]
+    module = ast.Module(
+        decls_body,
+        auto,
+        statements,
+        [items[number] for number in interface],
+        {key: ast.Comment(text, pos, line, column) for key, text, pos, line, column in comments},
+        module_scope,
+    )
+    return module, list(errors)
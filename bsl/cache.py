@@ -0,0 +1,204 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Кеш разобранных модулей на диске.
+
+Ключ модуля - хеш исходного текста, отпечатка внешней области видимости (см. fingerprint),
+режима мест (lazy_places) и версии парсера. Модули хранятся в каталоге кеша файлами <ключ>.ast
+в формате bsl.binary. Размер каталога ограничен: при превышении удаляются файлы,
+к которым дольше всего не обращались (время изменения файла обновляется при каждом попадании).
+
+Кеш включается для процесса функцией enable, после чего Parser.parse берет готовое дерево,
+если текст модуля и отпечаток области видимости совпадают с разобранным ранее.
+"""
+
+from typing import List, Dict, Tuple, Optional, Any, Sequence
+from enum import Enum
+import os
+import zlib
+import hashlib
+import bsl.ast as ast
+import bsl.binary as binary
+
+# предельный размер каталога кеша по умолчанию
+DEFAULT_LIMIT = 1 << 30
+
+# после вытеснения каталог занимает не больше этой доли предела
+EVICTION_TARGET = 0.9
+
+# отпечатки областей с таким числом элементов (глобальной, конфигурации) запоминаются на весь запуск
+SHARED_SCOPE_SIZE = 100
+
+# исходные тексты, от которых зависит результат разбора (входят в ключ)
+SOURCES = ('enums.py', 'ast.py', 'parser.py', 'binary.py')
+
+def describe(value: Any) -> str:
+    """ описание объявления без мест в исходном тексте (для отпечатка области видимости) """
+    if isinstance(value, ast.Node):
+        slots: Tuple[str, ...] = value.__slots__
+        fields = ','.join(describe(getattr(value, name)) for name in slots if name != 'Place')
+        return f'{type(value).__name__}({fields})'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(describe(item) for item in value) + ']'
+    if isinstance(value, Enum):
+        return value.name
+    return repr(value)
+
+def digest(scope: ast.Scope, outer: str) -> str:
+    """ отпечаток области видимости по отпечатку внешних областей outer """
+    result = hashlib.sha1(outer.encode())
+    for kind, items in ('v', scope.Vars), ('m', scope.Methods):
+        for key in sorted(items):
+            result.update(f'{kind}{key}:{items[key].Name}:{describe(items[key].Decl)};'.encode())
+    for decl in scope.Auto:
+        result.update(f'a{decl.Name};'.encode())
+    return result.hexdigest()
+
+def fingerprint(scope: Optional[ast.Scope], cache: Dict[int, str]) -> str:
+    """
+    Отпечаток области видимости вместе с внешними. Отпечатки кешируются в cache по id области,
+    поэтому общие области (глобальная, конфигурации) описываются один раз за запуск.
+    Области должны жить, пока жив cache.
+    """
+    if scope is None:
+        return ''
+    result = cache.get(id(scope))
+    if result is None:
+        result = cache[id(scope)] = digest(scope, fingerprint(scope.Outer, cache))
+    return result
+
+def version() -> str:
+    """ версия парсера: исходные тексты SOURCES и формат bsl.binary """
+    result = hashlib.sha1(f'{binary.FORMAT};'.encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            result.update(f.read())
+    return result.hexdigest()
+
+class Cache:
+
+    def __init__(self, directory: str, limit: int = DEFAULT_LIMIT):
+        """ directory - каталог кеша (создается при необходимости), limit - предельный размер в байтах """
+        self.directory = directory
+        self.limit = limit
+        self.version = version()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for path, size, mtime in self.files())
+        # id области -> (область, размеры, отпечаток); область хранится, чтобы ее id не достался другой
+        self.scopes: Dict[int, Tuple[ast.Scope, Tuple[int, int, int], str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, scope: Optional[ast.Scope]) -> str:
+        """
+        Отпечаток области видимости вместе с внешними (см. fingerprint).
+        Отпечаток большой области запоминается и пересчитывается, только если она выросла:
+        области видимости при обходе метаданных только пополняются.
+        """
+        if scope is None:
+            return ''
+        sizes = (len(scope.Vars), len(scope.Methods), len(scope.Auto))
+        entry = self.scopes.get(id(scope))
+        if entry is not None and entry[0] is scope and entry[1] == sizes:
+            return entry[2]
+        result = digest(scope, self.fingerprint(scope.Outer))
+        if sum(sizes) >= SHARED_SCOPE_SIZE:
+            self.scopes[id(scope)] = (scope, sizes, result)
+        return result
+
+    def key(self, src: str, scope: Optional[ast.Scope], lazy_places: bool) -> str:
+        """ ключ модуля с текстом src, разбираемого во внешней области scope """
+        result = hashlib.sha1(f'{self.version};{self.fingerprint(scope)};{lazy_places:d};'.encode())
+        result.update(src.encode('utf-8', 'surrogatepass'))
+        return result.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.ast')
+
+    def load(self, key: str, scope: Optional[ast.Scope], lines: Optional[ast.Lines]) -> Optional[Tuple[ast.Module, list]]:
+        """ модуль и ошибки разбора (кортежи text, pos, line) или None, если в кеше их нет """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            result = binary.decode(data, scope, lines)
+        except (OSError, EOFError, ValueError, TypeError, KeyError, IndexError, AttributeError, zlib.error):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return result
+
+    def store(self, key: str, module: ast.Module, errors: Sequence[Tuple[str, int, int]], lazy_places: bool):
+        """ сохраняет модуль; модули, которые нельзя закодировать (см. bsl.binary.Unsupported), пропускаются """
+        try:
+            data = binary.encode(module, [(text, pos, line) for text, pos, line in errors], lazy_places)
+        except binary.Unsupported:
+            return
+        path = self.path(key)
+        temp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temp, 'wb') as f:
+                f.write(data)
+            os.replace(temp, path)
+        except OSError:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            return
+        self.size += len(data)
+        if self.size > self.limit:
+            self.evict()
+
+    def files(self) -> List[Tuple[str, int, float]]:
+        """ файлы кеша: (путь, размер, время последнего обращения) """
+        result: List[Tuple[str, int, float]] = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return result
+        for entry in entries:
+            if entry.name.endswith('.ast'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                result.append((entry.path, stat.st_size, stat.st_mtime))
+        return result
+
+    def evict(self):
+        """
+        Удаляет файлы, к которым дольше всего не обращались, пока каталог не станет меньше
+        EVICTION_TARGET * limit. Каталог может использоваться несколькими процессами,
+        поэтому размер пересчитывается по файлам.
+        """
+        files = sorted(self.files(), key=lambda file: file[2])
+        self.size = sum(size for path, size, mtime in files)
+        target = self.limit * EVICTION_TARGET
+        for path, size, mtime in files:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+# кеш текущего процесса (None - кеш не используется)
+current: Optional[Cache] = None
+
+def enable(directory: str, limit: int = DEFAULT_LIMIT) -> Cache:
+    global current
+    current = Cache(directory, limit)
+    return current
+
+def disable():
+    global current
+    current = None
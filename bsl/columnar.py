@@ -0,0 +1,243 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Колоночное представление AST (параллельные массивы вместо объектов узлов).
+
+Предназначено для анализа конфигурации целиком: модуль в таком виде занимает
+в несколько раз меньше памяти, чем дерево из bsl.ast, и хорошо сериализуется.
+Запросы работают сразу с массивами номеров узлов, например все сложения со строковым операндом:
+
+    columns = convert(module)
+    adds = columns.select(ast.BinaryExpr, Tokens.ADD)
+    columns.with_child(adds, ast.StringExpr)
+"""
+
+from typing import List, Dict, Optional, Iterator, Callable, Tuple, Type, Any
+from enum import Enum
+from array import array
+import re
+from bsl.enums import Tokens, Keywords
+from bsl.visitor import kinds
+import bsl.ast as ast
+import bsl.fused as fused
+
+# Коды операторов и видов литералов: индексы в operators
+operators: List[Enum] = [*Tokens, *Keywords]
+operator_codes: Dict[Enum, int] = {member: code for code, member in enumerate(operators)}
+
+# Классы узлов по номерам видов (KindId)
+kind_classes: List[Type[ast.Node]] = [getattr(ast, kind) for kind in kinds]
+
+# Имена и тексты узлов, которые попадают в таблицу строк
+names: Dict[type, Callable[[Any], Optional[str]]] = {
+    ast.VarModDecl: lambda node: node.Name,
+    ast.VarLocDecl: lambda node: node.Name,
+    ast.AutoDecl: lambda node: node.Name,
+    ast.ParamDecl: lambda node: node.Name,
+    ast.ProcSign: lambda node: node.Name,
+    ast.FuncSign: lambda node: node.Name,
+    ast.BasicLitExpr: lambda node: node.Lit,
+    ast.FieldExpr: lambda node: node.Name,
+    ast.IdentExpr: lambda node: node.Head.Name,
+    ast.NewExpr: lambda node: node.Name,
+    ast.GotoStmt: lambda node: node.Label,
+    ast.LabelStmt: lambda node: node.Label,
+    ast.PrepRegionInst: lambda node: node.Name,
+    ast.PrepSymExpr: lambda node: node.Symbol,
+}
+
+# Поля с операторами и видами литералов
+operator_fields: Dict[type, str] = {
+    ast.UnaryExpr: 'Operator',
+    ast.BinaryExpr: 'Operator',
+    ast.PrepBinaryExpr: 'Operator',
+    ast.BasicLitExpr: 'Kind',
+}
+
+# Поля потомков: класс -> ((имя поля, поле-список), ...)
+children_fields: Dict[type, Tuple[Tuple[str, bool], ...]] = {
+    getattr(ast, node_type): tuple(
+        (name, kind in ('list', 'list?', 'args', 'items'))
+        for kind, name, category in fused.fields(node_type)
+    )
+    for node_type in fused.schema
+}
+
+class Columns:
+    """
+    AST модуля в виде параллельных массивов. Узлы нумеруются в порядке обхода визитером, 0 - модуль.
+    Для i-го узла хранится:
+    kinds[i] - номер вида узла (KindId, см. bsl.visitor.kinds);
+    parents[i], first_children[i], next_siblings[i] - номера родителя, первого потомка
+      и следующего потомка того же родителя (-1, если их нет);
+    begs[i], ends[i] - смещения начала и конца узла в исходном тексте;
+    operators[i] - код оператора или вида литерала (индекс в operators), -1 - нет;
+    names[i] - номер имени, метки или текста литерала в strings, -1 - нет.
+    Запросы возвращают массивы номеров узлов по возрастанию.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.parents = array('i')
+        self.first_children = array('i')
+        self.next_siblings = array('i')
+        self.begs = array('i')
+        self.ends = array('i')
+        self.operators = array('h')
+        self.names = array('i')
+        self.strings: List[str] = []
+        self.string_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def kind(self, index: int) -> type:
+        return kind_classes[self.kinds[index]]
+
+    def operator(self, index: int) -> Optional[Enum]:
+        code = self.operators[index]
+        return operators[code] if code >= 0 else None
+
+    def name(self, index: int) -> Optional[str]:
+        code = self.names[index]
+        return self.strings[code] if code >= 0 else None
+
+    def children(self, index: int) -> Iterator[int]:
+        child = self.first_children[index]
+        next_siblings = self.next_siblings
+        while child >= 0:
+            yield child
+            child = next_siblings[child]
+
+    def nbytes(self) -> int:
+        """ размер массивов в байтах (без таблицы строк) """
+        return sum(column.itemsize * len(column) for column in (
+            self.kinds, self.parents, self.first_children, self.next_siblings,
+            self.begs, self.ends, self.operators, self.names,
+        ))
+
+    def select(self, cls: Type[ast.Node], operator: Optional[Enum] = None) -> array:
+        """ узлы класса cls (с оператором operator) """
+        pattern = re.escape(bytes((cls.KindId,)))
+        result = array('i', [match.start() for match in re.finditer(pattern, self.kinds.tobytes())])
+        if operator is not None:
+            code = operator_codes[operator]
+            operators_ = self.operators
+            result = array('i', [index for index in result if operators_[index] == code])
+        return result
+
+    def named(self, nodes: array, name: str) -> array:
+        """ узлы из nodes с именем name (без учета регистра) """
+        name = name.lower()
+        codes = {code for code, string in enumerate(self.strings) if string.lower() == name}
+        names_ = self.names
+        return array('i', [index for index in nodes if names_[index] in codes])
+
+    def with_child(self, nodes: array, cls: Type[ast.Node]) -> array:
+        """ узлы из nodes, у которых есть непосредственный потомок класса cls """
+        kind = cls.KindId
+        kinds_, first_children, next_siblings = self.kinds, self.first_children, self.next_siblings
+        result = array('i')
+        for index in nodes:
+            child = first_children[index]
+            while child >= 0:
+                if kinds_[child] == kind:
+                    result.append(index)
+                    break
+                child = next_siblings[child]
+        return result
+
+    def with_parent(self, nodes: array, cls: Type[ast.Node]) -> array:
+        """ узлы из nodes, родитель которых класса cls """
+        kind = cls.KindId
+        kinds_, parents_ = self.kinds, self.parents
+        return array('i', [index for index in nodes if parents_[index] >= 0 and kinds_[parents_[index]] == kind])
+
+    def inside(self, nodes: array, cls: Type[ast.Node]) -> array:
+        """ узлы из nodes, у которых есть предок класса cls """
+        kind = cls.KindId
+        kinds_, parents_ = self.kinds, self.parents
+        result = array('i')
+        for index in nodes:
+            parent = parents_[index]
+            while parent >= 0:
+                if kinds_[parent] == kind:
+                    result.append(index)
+                    break
+                parent = parents_[parent]
+        return result
+
+def convert(module: ast.Module) -> Columns:
+    """
+    Переводит дерево модуля в колоночное представление за один проход (без рекурсии).
+    Узлы, которые не посещаются визитером (GlobalObject и т.п.), не переводятся.
+    """
+    columns = Columns()
+    kinds_ = columns.kinds.append
+    parents_ = columns.parents.append
+    first_children = columns.first_children
+    next_siblings = columns.next_siblings
+    begs = columns.begs.append
+    ends = columns.ends.append
+    operators_ = columns.operators.append
+    names_ = columns.names.append
+    strings = columns.strings
+    string_codes = columns.string_codes
+    last_children: List[int] = []
+
+    todo: List[Tuple[ast.Node, int]] = [(module, -1)]
+    pop = todo.pop
+    while todo:
+        node, parent = pop()
+        cls = type(node)
+        fields = children_fields.get(cls)
+        if fields is None:
+            continue
+        index = len(last_children)
+        kinds_(cls.KindId)
+        parents_(parent)
+        first_children.append(-1)
+        next_siblings.append(-1)
+        last_children.append(-1)
+        if parent >= 0:
+            last = last_children[parent]
+            if last < 0:
+                first_children[parent] = index
+            else:
+                next_siblings[last] = index
+            last_children[parent] = index
+        place = getattr(node, 'Place', None)
+        if place is None:
+            begs(0)
+            ends(0)
+        else:
+            begs(place.BegPos)
+            ends(place.EndPos)
+        field = operator_fields.get(cls)
+        operators_(operator_codes[getattr(node, field)] if field else -1)
+        get_name = names.get(cls)
+        name = get_name(node) if get_name else None
+        if name is None:
+            names_(-1)
+        else:
+            code = string_codes.get(name)
+            if code is None:
+                code = string_codes[name] = len(strings)
+                strings.append(name)
+            names_(code)
+        mark = len(todo)
+        for field_name, is_list in fields:
+            value = getattr(node, field_name)
+            if value is None:
+                continue
+            if is_list:
+                for child in value:
+                    if child is not None:
+                        todo.append((child, index))
+            else:
+                todo.append((value, index))
+        # потомки переводятся в прямом порядке
+        todo[mark:] = reversed(todo[mark:])
+    return columns
@@ -3,6 +3,7 @@
 # license that can be found in the LICENSE file.
 
 from enum import Enum, auto
+from typing import Dict
 
 class EnumBase(Enum):
 
@@ -11,6 +12,18 @@ class EnumBase(Enum):
         # pylint: disable=no-member
         return cls._member_map_.get(key.upper())
 
+    @classmethod
+    def spellings(cls) -> Dict[str, 'EnumBase']:
+        """
+        Таблица распространенных написаний имен без вызова upper():
+        как в определении (верхний регистр), в нижнем регистре и с заглавной буквы.
+        """
+        table: Dict[str, EnumBase] = {}
+        for name, member in cls.__members__.items():
+            for spelling in (name, name.lower(), name.capitalize()):
+                table[spelling] = member
+        return table
+
 class Keywords(EnumBase):
 
     IF = ЕСЛИ = auto()
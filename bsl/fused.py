@@ -0,0 +1,371 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Сгенерированный обход AST для фиксированного набора плагинов.
+
+Вместо цепочки Node.visit -> Visitor.visit_* -> perform -> хук для набора классов плагинов
+генерируется код, в котором хуки вызываются прямо из функций обхода узлов.
+Порядок вызовов, исключения хуков и контракт (node, stack, counters) те же, что у bsl.visitor.Visitor.
+Стек и счетчики поддерживаются, только если их читает хотя бы один хук (см. uses).
+Поддеревья, в которых не может быть узлов, нужных плагинам (см. needed_types), не обходятся.
+"""
+
+from typing import List, Dict, Callable, Tuple, Set, Optional
+from collections import defaultdict
+import dis
+import inspect
+import bsl.ast as ast
+from bsl.visitor import Visitor, aggregates, COUNTERS, hook_failed
+from plugins import Plugin
+from output.timings import Timings, timed
+
+# Порядок обхода потомков узлов (как в методах visit узлов ast).
+# Поле описывается как "вид Имя [категория]", категория - виды узлов, которые могут быть в поле:
+#   node F  - узел;                  node? F - узел или None
+#   list F  - список узлов;          list? F - список узлов или None
+#   args F  - аргументы (список или None, элементы могут быть None)
+#   items F - список, элементы которого могут быть None
+#   expr F  - корень выражения (visit_Expr/leave_Expr); expr? F - корень выражения или None
+#   prep F  - корень выражения препроцессора (visit_PrepExpr/leave_PrepExpr)
+schema: Dict[str, Tuple[str, ...]] = {
+    'Module': ('list Decls decl', 'list Auto auto', 'list Body stmt'),
+    'VarModListDecl': ('list List var',),
+    'VarModDecl': (),
+    'VarLocDecl': (),
+    'AutoDecl': (),
+    'ParamDecl': ('expr? Value',),
+    'MethodDecl': ('node Sign sign', 'list Vars var', 'list Auto auto', 'list Body stmt'),
+    'ProcSign': ('list Params param',),
+    'FuncSign': ('list Params param',),
+    'BasicLitExpr': (),
+    'FieldExpr': ('args Args expr',),
+    'IndexExpr': ('node Expr expr',),
+    'IdentExpr': ('args Args expr', 'list Tail tail'),
+    'UnaryExpr': ('node Operand expr',),
+    'BinaryExpr': ('node Left expr', 'node Right expr'),  # обходится без рекурсии по левой ветви
+    'NewExpr': ('items Args expr',),
+    'TernaryExpr': ('node Cond expr', 'node Then expr', 'node Else expr', 'list Tail tail'),
+    'ParenExpr': ('node Expr expr',),
+    'NotExpr': ('node Expr expr',),
+    'StringExpr': ('list List lit',),
+    'AssignStmt': ('expr Left', 'expr Right'),
+    'ReturnStmt': ('expr? Expr',),
+    'BreakStmt': (),
+    'ContinueStmt': (),
+    'RaiseStmt': ('expr? Expr',),
+    'ExecuteStmt': ('expr Expr',),
+    'CallStmt': ('expr Ident',),
+    'IfStmt': ('expr Cond', 'list Then stmt', 'list? ElsIf elsif', 'node? Else else'),
+    'ElseStmt': ('list Body stmt',),
+    'ElsIfStmt': ('expr Cond', 'list Then stmt'),
+    'WhileStmt': ('expr Cond', 'list Body stmt'),
+    'ForStmt': ('expr Ident', 'expr From', 'expr To', 'list Body stmt'),
+    'ForEachStmt': ('expr Ident', 'expr In', 'list Body stmt'),
+    'TryStmt': ('list Try stmt', 'node Except except'),
+    'ExceptStmt': ('list Body stmt',),
+    'GotoStmt': (),
+    'LabelStmt': (),
+    'PrepIfInst': ('prep Cond',),
+    'PrepElsIfInst': ('prep Cond',),
+    'PrepElseInst': (),
+    'PrepEndIfInst': (),
+    'PrepRegionInst': (),
+    'PrepEndRegionInst': (),
+    'PrepBinaryExpr': ('node Left prep', 'node Right prep'),
+    'PrepNotExpr': ('node Expr prep',),
+    'PrepSymExpr': (),
+    'PrepParenExpr': ('node Expr prep',),
+}
+
+prep_insts = ('PrepIfInst', 'PrepElsIfInst', 'PrepElseInst', 'PrepEndIfInst', 'PrepRegionInst', 'PrepEndRegionInst')
+
+categories: Dict[str, Tuple[str, ...]] = {
+    'decl': ('VarModListDecl', 'MethodDecl', *prep_insts),
+    'var': ('VarModDecl', 'VarLocDecl'),
+    'auto': ('AutoDecl',),
+    'param': ('ParamDecl',),
+    'sign': ('ProcSign', 'FuncSign'),
+    'stmt': ('AssignStmt', 'ReturnStmt', 'BreakStmt', 'ContinueStmt', 'RaiseStmt', 'ExecuteStmt',
+             'CallStmt', 'IfStmt', 'WhileStmt', 'ForStmt', 'ForEachStmt', 'TryStmt',
+             'GotoStmt', 'LabelStmt', *prep_insts),
+    'elsif': ('ElsIfStmt',),
+    'else': ('ElseStmt',),
+    'except': ('ExceptStmt',),
+    'expr': ('BasicLitExpr', 'FieldExpr', 'IndexExpr', 'IdentExpr', 'UnaryExpr', 'BinaryExpr',
+             'NewExpr', 'TernaryExpr', 'ParenExpr', 'NotExpr', 'StringExpr'),
+    'tail': ('FieldExpr', 'IndexExpr'),
+    'lit': ('BasicLitExpr',),
+    'prep': ('PrepBinaryExpr', 'PrepNotExpr', 'PrepSymExpr', 'PrepParenExpr'),
+}
+
+# Интересы плагина: необязательный атрибут класса interests с именами типов узлов,
+# которые плагин должен получать в хуках. По умолчанию интересы выводятся из имен хуков
+# (хуки visit_Expr/leave_Expr требуют только корней выражений).
+# Имена EXPRESSIONS и PREP_EXPRESSIONS в interests означают все выражения ниже уровня операторов.
+EXPRESSIONS = 'Expr'
+PREP_EXPRESSIONS = 'PrepExpr'
+
+def interests(plugin_class: type, table: Dict[str, List[int]], index: int) -> Set[str]:
+    """ типы узлов, которые нужны плагину с номером index в наборе """
+    declared = getattr(plugin_class, 'interests', None)
+    if declared is None:
+        return {name[6:] for name, indices in table.items()
+                         if index in indices and name[6:] in schema}
+    result: Set[str] = set()
+    for name in declared:
+        if name == EXPRESSIONS:
+            result.update(categories['expr'])
+        elif name == PREP_EXPRESSIONS:
+            result.update(categories['prep'])
+        else:
+            result.add(name)
+    return result
+
+def fields(node_type: str) -> List[Tuple[str, str, str]]:
+    """ поля узла в виде (вид, имя, категория) """
+    result = []
+    for field in schema[node_type]:
+        kind, name, *category = field.split()
+        result.append((kind, name, category[0] if category else 'prep' if kind == 'prep' else 'expr'))
+    return result
+
+def needed_types(classes: Tuple[type, ...], table: Dict[str, List[int]]) -> Set[str]:
+    """
+    Типы узлов, которые нужно обходить: интересные плагинам, содержащие корни выражений
+    при наличии хуков visit_Expr/leave_Expr (visit_PrepExpr/leave_PrepExpr),
+    а также типы, в поддеревьях которых могут быть нужные узлы. Остальные поддеревья пропускаются.
+    """
+    needed: Set[str] = set()
+    for index, plugin_class in enumerate(classes):
+        needed.update(interests(plugin_class, table, index))
+    roots = {
+        'expr': bool(table.get('visit_Expr') or table.get('leave_Expr')),
+        'prep': bool(table.get('visit_PrepExpr') or table.get('leave_PrepExpr')),
+    }
+    for node_type in schema:
+        for kind, name, category in fields(node_type):
+            if kind in ('expr', 'expr?', 'prep') and roots[category]:
+                needed.add(node_type)
+    if table.get('visit_Comment'):
+        needed.add('Module')
+    changed = True
+    while changed:
+        changed = False
+        for node_type in schema:
+            if node_type not in needed:
+                for kind, name, category in fields(node_type):
+                    if needed.intersection(categories[category]):
+                        needed.add(node_type)
+                        changed = True
+                        break
+    return needed
+
+# Сгенерированные обходы по набору классов плагинов
+traversals: Dict[Tuple[type, ...], Callable] = {}
+
+def ignore(node):
+    """ обход узлов, которые не посещаются (GlobalObject и т.п.) """
+
+# Флаги кода функции с *args и **kwargs
+VARARGS = inspect.CO_VARARGS | inspect.CO_VARKEYWORDS
+
+# Имена, через которые функция может прочитать параметр, не загружая его по имени
+DYNAMIC = {'locals', 'vars', 'eval', 'exec'}
+
+def uses(plugin_class: type, name: str, param: str) -> bool:
+    """
+    Проверяет, нужен ли хуку name класса plugin_class параметр param ('stack' или 'counters').
+    Объявление класса (Plugin.context) считается точным, иначе проверяется код хука (см. reads).
+    """
+    context = getattr(plugin_class, 'context', None)
+    if context is not None:
+        return param in context
+    return reads(getattr(plugin_class, name), -2 if param == 'stack' else -1)
+
+def reads(hook: Callable, param: int) -> bool:
+    """
+    Проверяет, обращается ли хук к своему параметру с номером param
+    (с конца: -2 - stack, -1 - counters).
+    Если по коду хука этого нельзя исключить (код недоступен, *args, обертка декоратора,
+    замыкание, locals() и т.п.), считается, что обращается.
+    """
+    if hasattr(hook, '__wrapped__'):
+        return True
+    code = getattr(getattr(hook, '__func__', hook), '__code__', None)
+    if code is None or code.co_argcount < 3 or code.co_flags & VARARGS:
+        return True
+    if code.co_freevars or code.co_cellvars or DYNAMIC.intersection(code.co_names):
+        return True
+    name = code.co_varnames[code.co_argcount + param]
+    for instruction in dis.get_instructions(code):
+        if instruction.opname.startswith('LOAD_'):
+            argval = instruction.argval
+            if argval == name or isinstance(argval, tuple) and name in argval:
+                return True
+    return False
+
+def generate(classes: Tuple[type, ...]) -> str:
+    """
+    Генерирует исходный текст функции make(plugins, stack, counters, hook),
+    которая возвращает словарь: тип узла -> функция обхода.
+    Хуки берутся вызовом hook(плагин, имя хука) (getattr или output.timings.timed).
+    """
+    table = Visitor.hook_table(classes)
+    needed = needed_types(classes, table)
+    hooks = [(index, name) for name, indices in table.items() for index in indices]
+    node_hooks = [(index, name) for index, name in hooks if name != 'visit_Comment']
+    use_stack = any(uses(classes[index], name, 'stack') for index, name in node_hooks)
+    use_counters = any(uses(classes[index], name, 'counters') for index, name in node_hooks)
+
+    variables: Dict[Tuple[int, str], str] = {}
+    lines = ['def make(plugins, stack, counters, hook):']
+    for index, name in hooks:
+        variables[index, name] = variable = f'h{len(variables)}'
+        lines.append(f'    {variable} = hook(plugins[{index}], {name!r})')
+    lines.append('    append = stack.append')
+    lines.append('    pop = stack.pop')
+
+    def calls(name: str, arg: str, indent: str) -> List[str]:
+        code = []
+        for index in table.get(name, ()):
+            code.append(f'{indent}try:')
+            code.append(f'{indent}    {variables[index, name]}({arg}, stack, counters)')
+            code.append(f'{indent}except Exception as e:')
+            code.append(f'{indent}    hook_failed(e)')
+        return code
+
+    def push(node_type: str, indent: str) -> List[str]:
+        code = []
+        if use_stack:
+            code.append(f'{indent}append(node)')
+        if use_counters:
+            kind_id = getattr(ast, node_type).KindId
+            code.append(f'{indent}counters[{kind_id}] += 1')
+            for index, delta in aggregates.get(node_type, ()):
+                code.append(f'{indent}counters[{index}] += {delta}')
+        return code
+
+    def pop_(node_type: str, indent: str) -> List[str]:
+        code = []
+        if use_stack:
+            code.append(f'{indent}pop()')
+        if use_counters:
+            kind_id = getattr(ast, node_type).KindId
+            code.append(f'{indent}counters[{kind_id}] -= 1')
+            for index, delta in aggregates.get(node_type, ()):
+                code.append(f'{indent}counters[{index}] -= {delta}')
+        return code
+
+    def child(kind: str, name: str, category: str, indent: str) -> List[str]:
+        i = indent
+        if not needed.intersection(categories[category]):
+            if kind not in ('expr', 'expr?', 'prep'):
+                return []
+            # поддерево пропускается, но хуки корня выражения вызываются
+            root = 'PrepExpr' if kind == 'prep' else 'Expr'
+            code = [f'{i}x = node.{name}']
+            if kind == 'expr?':
+                code.append(f'{i}if x is not None:')
+                i += '    '
+            code.extend(calls('visit_' + root, 'x', i))
+            code.extend(calls('leave_' + root, 'x', i))
+            return code if len(code) > 2 else []
+        if kind == 'node':
+            return [f'{i}x = node.{name}', f'{i}d[type(x)](x)']
+        if kind == 'node?':
+            return [f'{i}x = node.{name}', f'{i}if x is not None:', f'{i}    d[type(x)](x)']
+        if kind == 'list':
+            return [f'{i}for x in node.{name}:', f'{i}    d[type(x)](x)']
+        if kind == 'list?':
+            return [f'{i}xs = node.{name}', f'{i}if xs is not None:',
+                    f'{i}    for x in xs:', f'{i}        d[type(x)](x)']
+        if kind == 'args':
+            return [f'{i}xs = node.{name}', f'{i}if xs is not None:', f'{i}    for x in xs:',
+                    f'{i}        if x is not None:', f'{i}            d[type(x)](x)']
+        if kind == 'items':
+            return [f'{i}for x in node.{name}:', f'{i}    if x is not None:', f'{i}        d[type(x)](x)']
+        root = 'PrepExpr' if kind == 'prep' else 'Expr'
+        code = [f'{i}x = node.{name}']
+        if kind == 'expr?':
+            code.append(f'{i}if x is not None:')
+            i += '    '
+        code.extend(calls('visit_' + root, 'x', i))
+        code.append(f'{i}d[type(x)](x)')
+        code.extend(calls('leave_' + root, 'x', i))
+        return code
+
+    for node_type in schema:
+        if node_type not in needed:
+            continue
+        stacked = 'leave_' + node_type in table and node_type not in Visitor.unstacked
+        lines.append(f'    def visit_{node_type}(node):')
+        body: List[str] = []
+        if node_type == 'BinaryExpr':
+            body.append('        chain = []')
+            body.append('        while type(node) is BinaryExpr:')
+            body.extend(calls('visit_BinaryExpr', 'node', ' ' * 12))
+            body.extend(push(node_type, ' ' * 12))
+            body.append('            chain.append(node)')
+            body.append('            node = node.Left')
+            body.append('        d[type(node)](node)')
+            body.append('        for node in reversed(chain):')
+            body.append('            x = node.Right')
+            body.append('            d[type(x)](x)')
+            body.extend(pop_(node_type, ' ' * 12))
+            body.extend(calls('leave_BinaryExpr', 'node', ' ' * 12))
+        else:
+            body.extend(calls('visit_' + node_type, 'node', ' ' * 8))
+            if stacked:
+                body.extend(push(node_type, ' ' * 8))
+            for kind, name, category in fields(node_type):
+                body.extend(child(kind, name, category, ' ' * 8))
+            if node_type == 'Module' and table.get('visit_Comment'):
+                # комментарии в порядке строк перед leave_Module (как у Visitor)
+                body.append('        comments = node.Comments')
+                body.append('        for line in sorted(comments):')
+                for index in table['visit_Comment']:
+                    body.append('            try:')
+                    body.append(f'                {variables[index, "visit_Comment"]}(comments[line])')
+                    body.append('            except Exception as e:')
+                    body.append('                hook_failed(e)')
+            if stacked:
+                body.extend(pop_(node_type, ' ' * 8))
+                body.extend(calls('leave_' + node_type, 'node', ' ' * 8))
+        lines.extend(body or ['        pass'])
+
+    lines.append('    d = defaultdict(lambda: ignore)')
+    for node_type in schema:
+        if node_type in needed:
+            lines.append(f'    d[{node_type}] = visit_{node_type}')
+    lines.append('    return d')
+    return '\n'.join(lines) + '\n'
+
+def compile_traversal(classes: Tuple[type, ...]) -> Callable:
+    """
+    Возвращает (и кэширует) функцию make(plugins, stack, counters, hook) для набора классов плагинов.
+    """
+    make = traversals.get(classes)
+    if make is None:
+        namespace = {name: getattr(ast, name) for name in schema}
+        namespace['defaultdict'] = defaultdict
+        namespace['ignore'] = ignore
+        namespace['hook_failed'] = hook_failed
+        source = generate(classes)
+        exec(compile(source, '<fused ' + ', '.join(cls.__name__ for cls in classes) + '>', 'exec'), namespace)
+        make = traversals[classes] = namespace['make']
+    return make
+
+def visit(node: ast.Node, plugins: List[Plugin], timings: Optional[Timings] = None):
+    """
+    Обходит дерево node с плагинами plugins (то же, что node.visit(Visitor(plugins, timings))).
+    """
+    make = compile_traversal(tuple(type(plugin) for plugin in plugins))
+    if timings is None:
+        dispatch = make(plugins, [], [0] * COUNTERS, getattr)
+    else:
+        def hook(plugin: Plugin, name: str) -> Callable:
+            return timed(plugin, name, timings)
+        dispatch = make(plugins, [], [0] * COUNTERS, hook)
+    dispatch[type(node)](node)
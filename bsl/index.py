@@ -0,0 +1,126 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Индекс узлов модуля для плагинов-запросов.
+
+Плагину-запросу не нужны хуки визитера: он объявляет метод query(index: ast.Index) (см. QueryPlugin)
+и сам выбирает нужные узлы, например index.of(ast.NewExpr) или index.of(ast.ExceptStmt).
+Если у модуля все плагины - запросы, обход дерева (Module.visit) не выполняется.
+"""
+
+from typing import List, Dict, Optional, Protocol, runtime_checkable
+from collections import defaultdict
+import bsl.ast as ast
+import bsl.fused as fused
+from bsl.visitor import hook_failed
+from plugins import Plugin
+from output.timings import Timings, timed
+
+def generate() -> str:
+    """
+    Генерирует исходный текст функции make(nodes, parents), которая возвращает словарь:
+    тип узла -> функция f(node, parent), добавляющая узел и его поддерево в индекс
+    (как в bsl.fused, левая ветвь BinaryExpr обходится без рекурсии).
+    """
+    lines = ['def make(nodes, parents):']
+    for node_type in fused.schema:
+        lines.append(f'    a_{node_type} = nodes[{node_type}].append')
+    for node_type in fused.schema:
+        lines.append(f'    def index_{node_type}(node, parent):')
+        if node_type == 'BinaryExpr':
+            lines.append('        chain = []')
+            lines.append('        while type(node) is BinaryExpr:')
+            lines.append('            a_BinaryExpr(node)')
+            lines.append('            parents[node] = parent')
+            lines.append('            chain.append(node)')
+            lines.append('            parent = node')
+            lines.append('            node = node.Left')
+            lines.append('        d[type(node)](node, parent)')
+            lines.append('        for node in reversed(chain):')
+            lines.append('            x = node.Right')
+            lines.append('            d[type(x)](x, node)')
+            continue
+        lines.append(f'        a_{node_type}(node)')
+        lines.append('        parents[node] = parent')
+        for kind, name, category in fused.fields(node_type):
+            if kind in ('node', 'expr', 'prep'):
+                lines.append(f'        x = node.{name}')
+                lines.append('        d[type(x)](x, node)')
+            elif kind in ('node?', 'expr?'):
+                lines.append(f'        x = node.{name}')
+                lines.append('        if x is not None:')
+                lines.append('            d[type(x)](x, node)')
+            elif kind == 'list':
+                lines.append(f'        for x in node.{name}:')
+                lines.append('            d[type(x)](x, node)')
+            elif kind == 'list?':
+                lines.append(f'        xs = node.{name}')
+                lines.append('        if xs is not None:')
+                lines.append('            for x in xs:')
+                lines.append('                d[type(x)](x, node)')
+            elif kind == 'args':
+                lines.append(f'        xs = node.{name}')
+                lines.append('        if xs is not None:')
+                lines.append('            for x in xs:')
+                lines.append('                if x is not None:')
+                lines.append('                    d[type(x)](x, node)')
+            else:  # items
+                lines.append(f'        for x in node.{name}:')
+                lines.append('            if x is not None:')
+                lines.append('                d[type(x)](x, node)')
+    lines.append('    d = defaultdict(lambda: skip)')
+    for node_type in fused.schema:
+        lines.append(f'    d[{node_type}] = index_{node_type}')
+    lines.append('    return d')
+    return '\n'.join(lines) + '\n'
+
+def skip(node, parent):
+    """ узлы, которые не посещаются визитером (GlobalObject и т.п.), в индекс не попадают """
+
+namespace = {name: getattr(ast, name) for name in fused.schema}
+namespace['defaultdict'] = defaultdict
+namespace['skip'] = skip
+exec(compile(generate(), '<index>', 'exec'), namespace)
+make = namespace['make']
+
+def build(module: ast.Module) -> ast.Index:
+    """
+    Строит индекс за один проход по дереву.
+    Узлы каждого класса идут в порядке обхода визитером.
+    """
+    nodes: Dict[type, List[ast.Node]] = {getattr(ast, node_type): [] for node_type in fused.schema}
+    parents: Dict[ast.Node, Optional[ast.Node]] = {}
+    make(nodes, parents)[ast.Module](module, None)
+    return ast.Index({cls: items for cls, items in nodes.items() if items}, parents)
+
+@runtime_checkable
+class QueryPlugin(Protocol):
+    """ плагин-запрос: получает индекс модуля вместо хуков визитера """
+
+    def query(self, index: ast.Index) -> None:
+        ...
+
+def is_query(plugin: object) -> bool:
+    return isinstance(plugin, QueryPlugin)
+
+def run(module: ast.Module, plugins: List[Plugin], timings: Optional[Timings] = None):
+    """
+    Передает модуль плагинам: плагинам-запросам - индекс (строится, если его нет),
+    остальным - сгенерированный обход дерева (см. bsl.fused.visit).
+    """
+    visited = [plugin for plugin in plugins if not is_query(plugin)]
+    if visited:
+        fused.visit(module, visited, timings)
+    if len(visited) < len(plugins):
+        index = module.Index
+        if index is None:
+            index = module.Index = build(module)
+        for plugin in plugins:
+            if isinstance(plugin, QueryPlugin):
+                query = plugin.query if timings is None else timed(plugin, 'query', timings)
+                try:
+                    query(index)
+                except Exception as e:
+                    hook_failed(e)
@@ -0,0 +1,123 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Анализ большого модуля по частям в нескольких процессах.
+
+Модуль делится на части по методам верхнего уровня. Каждый процесс сам разбирает модуль
+без тел методов (Parser.skip_bodies): это дает объявления, сигнатуры всех методов модуля,
+интерфейс и операторы модуля. Затем он разбирает тела методов своей части (см. split)
+и передает часть плагинам как отдельный ast.Module. В родительский процесс возвращаются
+только замечания, деревья между процессами не передаются.
+
+Часть 0, кроме своих методов, содержит все объявления верхнего уровня, кроме методов
+(переменные, инструкции препроцессора), автоматические переменные и операторы модуля.
+Комментарии части - комментарии строк ее методов (для части 0 - и все комментарии вне методов).
+
+Модуль делится, только если все плагины объявили это допустимым (атрибут класса split,
+см. plugins.Plugin): замечания такого плагина не зависят от того, видит ли он методы модуля вместе.
+Плагины уровня токенов (см. bsl.tokens) в части 0 получают токены и комментарии всего модуля.
+"""
+
+from typing import List, Dict, Optional, Iterable
+from bisect import bisect_right
+import bsl.ast as ast
+from bsl.enums import Tokens
+from bsl.parser import Parser
+
+def splittable(classes: Iterable[type]) -> bool:
+    """ модуль с плагинами классов classes можно анализировать по частям """
+    return all(getattr(cls, 'split', False) for cls in classes)
+
+def split(decls: List[ast.Decl], parts: int) -> List[List[ast.MethodDecl]]:
+    """
+    Делит методы из decls на группы подряд идущих методов
+    примерно равного размера исходного текста (не более parts групп).
+    """
+    methods = [decl for decl in decls if isinstance(decl, ast.MethodDecl)]
+    total = sum(method.Place.EndPos - method.Place.BegPos for method in methods)
+    limit = total / max(parts, 1)
+    groups: List[List[ast.MethodDecl]] = []
+    group: List[ast.MethodDecl] = []
+    size = 0
+    for method in methods:
+        group.append(method)
+        size += method.Place.EndPos - method.Place.BegPos
+        if size >= limit and len(groups) < parts - 1:
+            groups.append(group)
+            group, size = [], 0
+    if group:
+        groups.append(group)
+    return groups
+
+def parse(src: str, scope: ast.Scope, part: int, parts: int) -> ast.Module:
+    """
+    Разбирает часть part из parts модуля с текстом src во внешней области scope (места ленивые).
+    Если разбор метода отдельно не сходится с разбором без тел (конец метода найден в другом месте),
+    модуль разбирается целиком, и часть выбирается по границам методов.
+    Синтаксические ошибки модуля приводят к исключению в любой части, как и при обычном разборе.
+    """
+    header = Parser(src, scope, lazy_places=True)
+    header.skip_bodies = True
+    module = header.parseModule()
+    header.expect(Tokens.EOF)
+    groups = split(module.Decls, parts)
+    group = groups[part] if part < len(groups) else []
+    parser = Parser(src, lazy_places=True)
+    assert module.Scope is not None
+    methods: List[ast.MethodDecl] = []
+    for method in group:
+        decl = parser.reparseMethodDecl(method, module.Scope)
+        if decl.Place.EndPos != method.Place.EndPos:
+            full = Parser(src, scope, lazy_places=True).parse()
+            begs = [(method.Place.BegPos, method.Place.EndPos) for method in group]
+            selected = [
+                decl for decl in full.Decls
+                if isinstance(decl, ast.MethodDecl) and any(beg <= decl.Place.BegPos < end for beg, end in begs)
+            ]
+            return piece(full, full.Decls, full.Comments, selected, part == 0)
+        methods.append(decl)
+    parser.collect_comments()
+    bodies = {id(method): decl for method, decl in zip(group, methods)}
+    # комментарии заголовков и концов методов собирает разбор без тел, комментарии тел - разбор частей
+    comments = dict(header.comments)
+    comments.update(parser.comments)
+    decls = [bodies.get(id(decl), decl) for decl in module.Decls]
+    return piece(module, decls, comments, methods, part == 0)
+
+def piece(module: ast.Module, decls: List[ast.Decl], comments: Dict[int, ast.Comment],
+          methods: List[ast.MethodDecl], first: bool) -> ast.Module:
+    """
+    Собирает часть модуля из методов methods (в порядке decls), а для первой части -
+    и из остальных объявлений, автоматических переменных и операторов модуля.
+    Комментарий относится к методу, в строках которого находится, или к первой части.
+    """
+    own = {id(method) for method in methods}
+    ranges = [decl for decl in decls if isinstance(decl, ast.MethodDecl)]
+    starts = [decl.Place.BegLine for decl in ranges]
+    result: Dict[int, ast.Comment] = {}
+    for line in sorted(comments):
+        index = bisect_right(starts, line) - 1
+        if index >= 0 and line <= ranges[index].Place.EndLine:
+            if id(ranges[index]) in own:
+                result[line] = comments[line]
+        elif first:
+            result[line] = comments[line]
+    if first:
+        selected = [decl for decl in decls if id(decl) in own or not isinstance(decl, ast.MethodDecl)]
+        return ast.Module(selected, module.Auto, module.Body, module.Interface, result, module.Scope)
+    selected = [decl for decl in decls if id(decl) in own]
+    return ast.Module(selected, [], [], [], result, module.Scope)
+
+def merge(parts: List[List[Optional[list]]]) -> List[list]:
+    """
+    Объединяет результаты плагинов по частям модуля (списки одинаковой длины, по плагину на элемент).
+    None - результат плагина в части не получен (часть не удалось разобрать):
+    результат такого плагина отбрасывается целиком.
+    """
+    results = []
+    for items in zip(*parts):
+        if all(item is not None for item in items):
+            results.append([issue for item in items for issue in item])
+    return results
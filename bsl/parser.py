@@ -3,11 +3,18 @@
 # license that can be found in the LICENSE file.
 
 from decimal import Decimal
-from typing import List, Union, Dict, Optional, Tuple
+from typing import List, Union, Dict, Optional, Tuple, Callable
 from collections import namedtuple
+from enum import Enum, auto
+from array import array
+import re
 from bsl.enums import Tokens, Keywords, Directives, PrepInstructions, PrepSymbols
 import bsl.ast as ast
+import bsl.index
+import bsl.cache
 from bsl.glob import scope as global_scope
+from bsl.visitor import Visitor
+from plugins import Plugin
 
 tokens_map: Dict[str, Tokens] = {
     '=': Tokens.EQL,
@@ -27,6 +34,88 @@ tokens_map: Dict[str, Tokens] = {
     '': Tokens.EOF,
 }
 
+class Lexers(Enum):
+    CHAR = auto()    # посимвольный сканер
+    TABLE = auto()   # табличный сканер на регулярных выражениях
+
+# Табличный сканер выбирает токен целиком одним вызовом регулярного выражения.
+# Номер сработавшей группы (lastindex) определяет вид токена.
+# \s и \w в точности соответствуют str.isspace() и (str.isalnum() or '_'),
+# поэтому границы токенов совпадают с посимвольным сканером.
+token_re = re.compile(r"""
+    (\s*)                                           # 1 пробельные символы
+    (?:
+        ([A-Za-z_А-яЁё]\w*)                         # 2 идентификатор
+      | ([0-9]+(?:\.[0-9]*)?)                       # 3 число
+      | ((?:"[^"\n]*["\n]?)+)                       # 4 строка
+      | (\|[^"\n]*["\n]?(?:"[^"\n]*["\n]?)*)        # 5 часть многострочной строки
+      | (//)                                        # 6 комментарий
+      | (<>|<=|>=|[-+*/%=<>()\[\]?,.:;])            # 7 оператор
+      | ('[^'\n]*)                                  # 8 дата
+      | (&)                                         # 9 директива
+      | (\#)                                        # 10 инструкция препроцессора
+      | (.?)                                        # 11 прочее (в т.ч. конец текста)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+(
+    GROUP_IDENT,
+    GROUP_NUMBER,
+    GROUP_STRING,
+    GROUP_STRINGPART,
+    GROUP_COMMENT,
+    GROUP_OPERATOR,
+    GROUP_DATETIME,
+    GROUP_DIRECTIVE,
+    GROUP_PREP,
+    GROUP_OTHER,
+) = range(2, 12)
+
+operators_map: Dict[str, Tokens] = {
+    **tokens_map,
+    '<>': Tokens.NEQ,
+    '<=': Tokens.LEQ,
+    '>=': Tokens.GEQ,
+    '<': Tokens.LSS,
+    '>': Tokens.GTR,
+    '/': Tokens.DIV,
+}
+
+# Операторы, для которых посимвольный сканер обновляет lit (для <, >, / и т.п. lit не меняется).
+lit_operators = set(tokens_map.values())
+
+space_re = re.compile(r'\s*')
+ident_re = re.compile(r'\w+')
+alnum_re = re.compile(r'[^\W_]+')
+digits_re = re.compile(r'[0-9]*')
+
+# Поиск конца тела метода без разбора (см. Parser.skipMethodBody): строки, комментарии, даты
+# и имена полей пропускаются, группа 1 - ключевое слово конца метода.
+method_end_re = re.compile(r"""
+    (?:"[^"\n]*["\n]?)+
+  | \|[^"\n]*["\n]?(?:"[^"\n]*["\n]?)*
+  | //[^\n]*
+  | '[^'\n]*
+  | \.\s*[A-Za-z_А-яЁё]\w*
+  | (?<!\w)(КонецПроцедуры|КонецФункции|EndProcedure|EndFunction)(?!\w)
+""", re.VERBOSE | re.IGNORECASE)
+
+# Поиск комментариев без разбора (см. scan_comments): строки и даты пропускаются, как сканером,
+# группа 1 - текст комментария (комментарий без перевода строки в конце текста сканер не запоминает).
+comment_re = re.compile(r"""
+    (?:"[^"\n]*["\n]?)+
+  | \|[^"\n]*["\n]?(?:"[^"\n]*["\n]?)*
+  | //([^\n]*)\n
+  | '[^'\n]*.?
+""", re.VERBOSE | re.DOTALL)
+
+def match_digits(src: str, pos: int) -> int:
+    """ возвращает позицию за последней цифрой (str.isdigit) начиная с pos """
+    pos = digits_re.match(src, pos).end()  # type: ignore
+    while src[pos:pos+1].isdigit():  # цифры вне ASCII
+        pos = digits_re.match(src, pos + 1).end()  # type: ignore
+    return pos
+
 add_operators = {
     Tokens.ADD,
     Tokens.SUB,
@@ -47,6 +136,22 @@ rel_operators = {
     Tokens.GEQ,
 }
 
+# Приоритеты операторов выражения (чем больше, тем сильнее связывание)
+PREC_OR = 1
+PREC_AND = 2
+PREC_NOT = 3
+PREC_REL = 4
+PREC_ADD = 5
+PREC_MUL = 6
+
+binary_operators: Dict[Union[Tokens, Keywords], int] = {
+    Keywords.OR: PREC_OR,
+    Keywords.AND: PREC_AND,
+    **dict.fromkeys(rel_operators, PREC_REL),
+    **dict.fromkeys(add_operators, PREC_ADD),
+    **dict.fromkeys(mul_operators, PREC_MUL),
+}
+
 basic_lit_no_string = {
     Tokens.NUMBER,
     Tokens.DATETIME,
@@ -98,9 +203,185 @@ class AlreadyDeclared(ParserException):
 
 Error = namedtuple('Error', 'text pos line')
 
+# Правка текста модуля: фрагмент [pos, end) прежнего текста заменен на text
+Edit = namedtuple('Edit', 'pos end text')
+
+# Все виды токенов. Индекс в этом списке - компактный код вида токена в TokenBuffer.
+token_kinds: List[Enum] = [*Tokens, *Keywords, *Directives, *PrepInstructions]
+token_codes: Dict[Enum, int] = {tok: code for code, tok in enumerate(token_kinds)}
+
+# Написания ключевых слов, известные до сканирования (см. Parser.idents)
+keyword_spellings: Dict[str, Keywords] = Keywords.spellings()  # type: ignore
+
+class TokenBuffer:
+    """
+    Результат токенизации модуля целиком (для плагинов уровня токенов, см. bsl.tokens).
+    Для i-го токена хранится:
+    kinds[i] - код вида токена (индекс в token_kinds);
+    begs[i], lines[i], columns[i] - позиция, строка и колонка начала токена;
+    lits[i] - значение lit сканера после токена.
+    Последний токен - EOF или LABEL. Если токенизация прервалась на ошибке,
+    исключение хранится в поле error, а буфер содержит токены до ошибки.
+    Парсер из буфера не читает: разбор с чтением токенов по индексу был медленнее
+    разбора со сканером по запросу - токенизация целиком стоит не меньше сканирования,
+    а чтение из буфера все равно заполняет те же поля парсера для каждого токена.
+    """
+
+    def __init__(self, src: str):
+        self.src: str = src
+        self.kinds = array('B')
+        self.begs = array('i')
+        self.lines = array('i')
+        self.columns = array('i')
+        self.lits: List[str] = []
+        self.comments: Dict[int, ast.Comment] = {}
+        self.error: Optional[Exception] = None
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def kind(self, index: int) -> Enum:
+        return token_kinds[self.kinds[index]]
+
+    def lit(self, index: int) -> str:
+        return self.lits[index]
+
+def tokenize(src: str) -> TokenBuffer:
+    """
+    Разбивает исходный текст на токены табличным сканером парсера (Parser.scan_table).
+    """
+    buf = TokenBuffer(src)
+    parser = Parser(src)
+    scan = parser.scan
+    kinds = buf.kinds.append
+    begs = buf.begs.append
+    lines = buf.lines.append
+    columns = buf.columns.append
+    lits = buf.lits.append
+    eof, label = Tokens.EOF, Tokens.LABEL
+    try:
+        while True:
+            tok = scan()
+            kinds(token_codes[tok])
+            begs(parser.beg_pos)
+            lines(parser.beg_line)
+            columns(parser.beg_column)
+            lits(parser.lit)
+            if tok is eof or tok is label:
+                break
+    except Exception as e:
+        buf.error = e
+    buf.comments = parser.comments
+    return buf
+
+def scan_comments(src: str) -> Dict[int, ast.Comment]:
+    """
+    Комментарии модуля без токенизации (как TokenBuffer.comments, но и за лексической ошибкой).
+    """
+    comments: Dict[int, ast.Comment] = {}
+    line = 1
+    last = 0
+    for m in comment_re.finditer(src):
+        if m.lastindex:
+            beg = m.start(1)
+            line += src.count('\n', last, beg)
+            last = beg
+            comments[line] = ast.Comment(m.group(1), beg, line, beg - src.rfind('\n', 0, beg) - 1)
+    return comments
+
+def find_method_decl(decls: List[ast.Decl], edit: Edit) -> Optional[int]:
+    """
+    Возвращает индекс метода, внутри тела которого целиком находится правка (None, если такого нет).
+    """
+    for index, decl in enumerate(decls):
+        if isinstance(decl, ast.MethodDecl):
+            if decl.Sign.Place.EndPos <= edit.pos and edit.end <= decl.Place.EndPos:
+                return index
+            if decl.Place.BegPos > edit.pos:
+                break
+    return None
+
+def contains_regions(statements: List[ast.Stmt]) -> bool:
+    """
+    Проверяет, есть ли среди операторов (на любой глубине) инструкции #Область и #КонецОбласти.
+    """
+    for stmt in statements:
+        if isinstance(stmt, (ast.PrepRegionInst, ast.PrepEndRegionInst)):
+            return True
+        name: str
+        for name in stmt.__slots__:
+            value = getattr(stmt, name)
+            if isinstance(value, ast.Stmt):
+                value = [value]
+            if isinstance(value, list) and value and isinstance(value[0], ast.Stmt):
+                if contains_regions(value):
+                    return True
+    return False
+
+def shift_places(nodes: list, shift: Callable[[ast.Place], None]):
+    """
+    Применяет shift к местам всех узлов поддеревьев nodes (каждое место - один раз).
+    """
+    seen = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, ast.Node):
+            continue
+        name: str
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if name == 'Place':
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    shift(value)
+            elif isinstance(value, ast.Node):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+
+class Events:
+    """
+    Приемник узлов верхнего уровня при потоковом разборе (см. Parser.parse_stream).
+    Поддерево каждого узла сразу передается визитеру и не сохраняется.
+    Пока в модуле есть вызовы еще не объявленных методов (Parser.unknown),
+    узлы откладываются: визитер получает их, когда все эти методы объявлены, или в конце разбора.
+    """
+    __slots__ = ('parser', 'visitor', 'pending')
+
+    def __init__(self, parser: 'Parser', visitor: Visitor):
+        self.parser = parser
+        self.visitor = visitor
+        self.pending: List[ast.Node] = []
+
+    def append(self, node: ast.Node):
+        if self.parser.lazy_places:
+            self.parser.collect_comments()
+        if self.parser.unknown:
+            self.pending.append(node)
+            return
+        if self.pending:
+            self.flush()
+        node.visit(self.visitor)
+
+    def flush(self):
+        """ передает визитеру отложенные узлы """
+        for node in self.pending:
+            node.visit(self.visitor)
+        self.pending.clear()
+
 class Parser:
 
-    def __init__(self, src: str, scope: ast.Scope = None):
+    scan: Callable[[], Union[Tokens, Keywords]]
+
+    def __init__(self, src: str, scope: ast.Scope = None, lexer: Lexers = Lexers.TABLE, lazy_places: bool = False,
+                 node_index: bool = False):
+        """
+        lazy_places - узлы получают ast.LazyPlace со смещениями вместо ast.Place,
+        строки и колонки вычисляются по индексу строк только при обращении к ним.
+        Сканер в этом режиме всегда табличный и не отслеживает строки (параметр lexer не учитывается).
+        node_index - результат разбора получает индекс узлов в поле Index (см. bsl.index).
+        """
 
         self.src: str = src
 
@@ -118,8 +399,8 @@ class Parser:
 
         self.char: str = ""
         self.lit: str = ""
-        self.tok: Tokens
-        self.val: Union[Decimal, str, bool, None]
+        self.tok: Union[Tokens, Keywords]
+        self.value: Union[str, bool, None]  # значение, вычисленное сканером (см. val)
 
         self.scope: ast.Scope = scope or global_scope
         self.vars: Dict[str, ast.Item] = {}
@@ -137,21 +418,57 @@ class Parser:
 
         self.errors: List[Error] = []
 
-        self.scan()
+        # Классификация идентификаторов модуля: написание -> (общая строка, ключевое слово или None).
+        # Каждое написание приводится к верхнему регистру не более одного раза,
+        # а повторы имени в модуле разделяют одну строку.
+        self.idents: Dict[str, Tuple[str, Optional[Keywords]]] = {
+            spelling: (spelling, tok) for spelling, tok in keyword_spellings.items()
+        }
+
+        self.skip_bodies: bool = False  # методы разбираются без тел, только сигнатуры
+        self.events: Optional[Events] = None  # приемник объявлений и операторов модуля при потоковом разборе
+
+        self.lexer: Lexers = lexer
+        self.lazy_places: bool = lazy_places
+        self.node_index: bool = node_index
+        self.lines: Optional[ast.Lines] = None
+        self.comment_spans: List[Tuple[int, int]] = []
+
+        if lazy_places:
+            self.lines = ast.Lines(src)
+            self.scan = self.scan_table
+            self.place = self.place_lazy  # type: ignore
+            self.place_from = self.place_from_lazy  # type: ignore
+            self.marker = self.marker_lazy  # type: ignore
+            self.mark_at = self.mark_at_lazy  # type: ignore
+            self.end_here = self.end_here_lazy  # type: ignore
+        elif lexer == Lexers.TABLE:
+            self.scan = self.scan_table
+        else:
+            self.scan = self.scan_char
+
+        self.scan_char()  # холостой проход: курсор встает на начало исходника
 
     def next(self) -> str:
         self.cur_pos += 1
         self.char = self.src[self.cur_pos:self.cur_pos+1]
         return self.char
 
-    def scan(self) -> Tokens:
+    def classify(self, lit: str) -> Tuple[str, Optional[Keywords]]:
+        """ Определяет и запоминает, является ли новое написание идентификатора ключевым словом """
+        entry = self.idents[lit] = (lit, Keywords.get(lit))
+        return entry
+
+    def scan_char(self) -> Union[Tokens, Keywords]:
+
+        tok: Union[Tokens, Keywords, None]
 
         # конец предыдущего токена
         self.end_pos = self.cur_pos
         self.end_line = self.cur_line
         self.end_column = self.cur_pos - self.line_pos
 
-        self.val = None
+        self.value = None
 
         if self.lit[-1:] == '\n':
             self.cur_line += 1
@@ -179,17 +496,20 @@ class Parser:
                 beg = self.cur_pos
                 while self.next().isalnum() or self.char == '_':
                     pass
-                self.lit = self.src[beg:self.cur_pos]
+                lit = self.src[beg:self.cur_pos]
 
                 # lookup
-                tok = Keywords.get(self.lit)
+                entry = self.idents.get(lit)
+                if entry is None:
+                    entry = self.classify(lit)
+                self.lit, tok = entry
                 if tok is not None:
                     if tok is Keywords.TRUE:
-                        self.val = True
+                        self.value = True
                     elif tok is Keywords.FALSE:
-                        self.val = False
+                        self.value = False
                     elif tok is Keywords.NULL:
-                        self.val = None
+                        self.value = None
                     self.tok = tok
                     # TODO: canonical
                 else:
@@ -206,7 +526,6 @@ class Parser:
                         self.next()
 
                 self.lit = self.src[beg:self.cur_pos]
-                self.val = self.lit[1:-1].replace('""', '"')
 
                 if self.lit[-1] == '"':
                     self.tok = Tokens.STRING
@@ -225,7 +544,6 @@ class Parser:
                         self.next()
 
                 self.lit = self.src[beg:self.cur_pos]
-                self.val = self.lit[1:-1].replace('""', '"')
 
                 if self.lit[-1] == '"':
                     self.tok = Tokens.STRINGEND
@@ -243,7 +561,8 @@ class Parser:
                         pass
 
                 self.lit = self.src[beg:self.cur_pos]
-                self.val = Decimal(self.lit)
+                if not self.lit.isascii():
+                    Decimal(self.lit)  # значение вычисляется при обращении, но ошибка возникает здесь
                 self.tok = Tokens.NUMBER
 
             elif self.char == "'":
@@ -255,7 +574,7 @@ class Parser:
 
                 if self.char != '':
                     self.lit = self.src[beg:self.cur_pos]
-                    self.val = self.lit
+                    self.value = self.lit
                     self.next()
 
                 self.tok = Tokens.DATETIME
@@ -383,6 +702,208 @@ class Parser:
 
         return self.tok
 
+    def scan_table(self) -> Union[Tokens, Keywords]:
+        """
+        Табличный вариант scan_char().
+        Состояние парсера после сканирования (lit, val, позиции, строки, колонки)
+        в точности совпадает с состоянием после scan_char().
+        В режиме lazy_places строки не отслеживаются: заполняются только смещения, lit, val и tok,
+        а комментарии запоминаются смещениями (см. collect_comments).
+        """
+
+        src = self.src
+        pos = self.cur_pos
+        track_lines = not self.lazy_places
+        tok: Union[Tokens, Keywords, None]
+
+        # конец предыдущего токена
+        self.end_pos = pos
+        if track_lines:
+            self.end_line = self.cur_line
+            self.end_column = pos - self.line_pos
+            if self.lit[-1:] == '\n':
+                self.cur_line += 1
+                self.line_pos = pos
+
+        self.value = None
+
+        while True:
+
+            if pos >= len(src):
+                # за концом текста регулярное выражение не сдвигается, а позиция должна расти
+                self.beg_pos = pos
+                if track_lines:
+                    self.beg_line = self.cur_line
+                    self.beg_column = pos - self.line_pos
+                self.lit = ''
+                self.tok = Tokens.EOF
+                pos += 1
+                break
+
+            m = token_re.match(src, pos)
+            group = m.lastindex  # type: ignore
+
+            # начало следующего токена
+            self.beg_pos = beg = m.start(group)  # type: ignore
+            if track_lines:
+                # skip space
+                if beg > pos:
+                    lines = src.count('\n', pos, beg)
+                    if lines:
+                        self.cur_line += lines
+                        self.line_pos = src.rfind('\n', pos, beg) + 1
+                self.beg_line = self.cur_line
+                self.beg_column = beg - self.line_pos
+
+            pos = m.end()  # type: ignore
+
+            if group == GROUP_OTHER:
+                char = src[beg:pos]
+                if char == '~':
+                    # посимвольный сканер не сдвигает позицию на символе '~'
+                    self.lit = ''
+                    self.tok = Tokens.LABEL
+                    pos = beg
+                    break
+                tok = tokens_map.get(char)
+                if tok is not None:
+                    self.lit = char
+                    self.tok = tok
+                    if char == '':
+                        pos += 1
+                    break
+                if char.isalpha():
+                    group = GROUP_IDENT
+                    pos = ident_re.match(src, beg).end()  # type: ignore
+                elif char.isdigit():
+                    group = GROUP_NUMBER
+                    pos = beg
+                else:
+                    self.cur_pos = beg
+                    raise UnexpectedChar('Unknown char', self.mark_at(beg))
+
+            if group == GROUP_IDENT:
+
+                lit = src[beg:pos]
+
+                # lookup
+                entry = self.idents.get(lit)
+                if entry is None:
+                    entry = self.classify(lit)
+                self.lit, tok = entry
+                if tok is not None:
+                    if tok is Keywords.TRUE:
+                        self.value = True
+                    elif tok is Keywords.FALSE:
+                        self.value = False
+                    self.tok = tok
+                else:
+                    self.tok = Tokens.IDENT
+
+            elif group == GROUP_OPERATOR:
+
+                self.tok = tok = operators_map[src[beg:pos]]
+                if tok in lit_operators:
+                    self.lit = src[beg:pos]
+
+            elif group == GROUP_STRING:
+
+                self.lit = lit = src[beg:pos]
+                self.tok = Tokens.STRING if lit[-1] == '"' else Tokens.STRINGBEG
+
+            elif group == GROUP_STRINGPART:
+
+                self.lit = lit = src[beg:pos]
+                self.tok = Tokens.STRINGEND if lit[-1] == '"' else Tokens.STRINGMID
+
+            elif group == GROUP_NUMBER:
+
+                if src[pos:pos+1].isdigit() or pos == beg:  # цифры вне ASCII
+                    pos = match_digits(src, beg)
+                    if src[pos:pos+1] == '.':
+                        pos = match_digits(src, pos + 1)
+                    Decimal(src[beg:pos])  # значение вычисляется при обращении, но ошибка возникает здесь
+                self.lit = src[beg:pos]
+                self.tok = Tokens.NUMBER
+
+            elif group == GROUP_COMMENT:
+
+                # scan comment
+                pos = src.find('\n', beg + 2)
+                if pos >= 0:
+                    if track_lines:
+                        self.comments[self.cur_line] = ast.Comment(src[beg+2:pos], beg + 2, self.cur_line, beg + 2 - self.line_pos)
+                    else:
+                        self.comment_spans.append((beg + 2, pos))
+                else:
+                    pos = len(src)
+                continue
+
+            elif group == GROUP_DATETIME:
+
+                if pos < len(src):
+                    self.lit = self.value = src[beg:pos]
+                    pos += 1
+                self.tok = Tokens.DATETIME
+
+            elif group == GROUP_DIRECTIVE:
+
+                if not src[pos:pos+1].isalpha():
+                    self.cur_pos = pos
+                    raise UnexpectedChar('Directive expected', self.mark_at(pos))
+
+                end = alnum_re.match(src, pos).end()  # type: ignore
+                self.lit = lit = src[pos:end]
+
+                tok = Directives.get(lit)
+                if tok is None:
+                    self.cur_pos = end
+                    raise UnknownToken(f'Unknown directive: "{lit}"', self.mark_at(pos))
+                self.tok = tok
+                pos = end
+
+            else:  # GROUP_PREP
+
+                # skip space
+                end = space_re.match(src, pos).end()  # type: ignore
+                if end > pos:
+                    if track_lines:
+                        lines = src.count('\n', pos, end)
+                        if lines:
+                            self.cur_line += lines
+                            self.line_pos = src.rfind('\n', pos, end) + 1
+                    pos = end
+
+                if not src[pos:pos+1].isalpha():
+                    self.cur_pos = pos
+                    raise UnexpectedChar('Preprocessor instruction expected', self.mark_at(pos))
+
+                end = alnum_re.match(src, pos).end()  # type: ignore
+                self.lit = lit = src[pos:end]
+                pos = end
+
+                tok = PrepInstructions.get(lit)
+                if tok is None:
+                    self.cur_pos = pos
+                    raise UnknownToken(f'Unknown preprocessor instruction: "{lit}"', self.mark_at(pos))
+                self.tok = tok
+
+            break
+
+        self.cur_pos = pos
+        return self.tok
+
+    @property
+    def val(self) -> Union[Decimal, str, bool, None]:
+        """
+        Значение литерала текущего токена.
+        Числа и строки вычисляются по тексту литерала при обращении.
+        """
+        decode = ast.literal_values.get(self.tok)
+        if decode is None:
+            return self.value
+        return decode(self.lit)
+
     def place(self) -> ast.Place:
         return ast.Place(self.beg_pos, self.cur_pos, self.beg_line, self.cur_line, self.beg_column, self.cur_pos - self.line_pos)
 
@@ -395,11 +916,52 @@ class Parser:
     def place_from(self, marker) -> ast.Place:
         return ast.Place(marker.pos, self.end_pos, marker.line, self.end_line, marker.column, self.end_column)
 
+    def end_here(self):
+        # cheat code: узел заканчивается на строке текущего токена
+        self.end_line = self.cur_line
+        self.end_column = self.cur_pos - self.line_pos
+
+    # Варианты для режима lazy_places: маркер - это смещение, место - LazyPlace
+
+    def place_lazy(self) -> ast.LazyPlace:
+        return ast.LazyPlace(self.beg_pos, self.cur_pos, self.lines)
+
+    def mark_at_lazy(self, pos):
+        return Marker(pos, *self.lines.position(pos))
+
+    def marker_lazy(self):
+        return self.beg_pos
+
+    def place_from_lazy(self, marker) -> ast.LazyPlace:
+        return ast.LazyPlace(marker, self.end_pos, self.lines)
+
+    def end_here_lazy(self):
+        self.end_pos = self.cur_pos
+
+    def locate(self, marker) -> Marker:
+        """
+        Возвращает маркер с номером строки и колонкой.
+        В режиме lazy_places маркер является смещением и вычисляется по индексу строк.
+        """
+        if isinstance(marker, int):
+            return self.mark_at_lazy(marker)
+        return marker
+
+    def collect_comments(self):
+        """
+        Переносит комментарии, найденные scan_table() в режиме lazy_places, в self.comments.
+        """
+        for beg, end in self.comment_spans:
+            line, column = self.lines.position(beg)
+            self.comments[line] = ast.Comment(self.src[beg:end], beg, line, column)
+        self.comment_spans.clear()
+
     def expect(self, tok: Union[Tokens, Keywords]):
         if self.tok != tok:
             raise UnexpectedToken(f'{tok} expected', self.mark_at(self.beg_pos))
 
     def error(self, text, marker: Marker):
+        marker = self.locate(marker)
         self.errors.append(Error(text, marker.pos, marker.line))
 
     def find_var(self, name) -> Optional[ast.Item]:
@@ -432,19 +994,100 @@ class Parser:
         return scope
 
     def parse(self) -> ast.Module:
+        """
+        Если включен кеш разобранных модулей (см. bsl.cache), дерево берется из кеша,
+        когда текст модуля и отпечаток области видимости совпадают с разобранным ранее.
+        """
+        cache = bsl.cache.current
+        module = None
+        if cache is not None:
+            key = cache.key(self.src, self.scope, self.lazy_places)
+            cached = cache.load(key, self.scope, self.lines)
+            if cached is not None:
+                module, errors = cached
+                assert module.Scope is not None
+                self.errors = [Error(*error) for error in errors]
+                self.comments = module.Comments
+                self.interface = module.Interface
+                self.scope = module.Scope
+        if module is None:
+            module = self.parseModule()
+            self.check_unknown()
+            self.expect(Tokens.EOF)
+            if cache is not None:
+                cache.store(key, module, self.errors, self.lazy_places)
+        if self.node_index:
+            module.Index = bsl.index.build(module)
+        return module
+
+    def parse_stream(self, plugins: List[Plugin]) -> ast.Module:
+        """
+        Потоковый разбор: события visit_*/leave_* передаются плагинам по ходу разбора,
+        а каждое объявление и оператор модуля отбрасывается сразу после обхода.
+        В памяти одновременно находится только одно объявление верхнего уровня (например, метод).
+        Порядок событий тот же, что у Visitor, кроме автоматических переменных модуля:
+        они становятся известны только в конце и обходятся после операторов модуля.
+        Вызовы методов, объявленных ниже по модулю, плагины получают уже разрешенными (см. Events),
+        поэтому до объявления таких методов узлы накапливаются.
+        Возвращаемый модуль (он же передается в visit_Module) не содержит Decls и Body,
+        его Comments, Auto и Interface заполняются по ходу разбора и полны к leave_Module.
+        """
+        visitor = Visitor(plugins)
+        events = self.events = Events(self, visitor)
+        self.open_scope()
+        self.methods = self.scope.Methods
+        module = ast.Module([], self.scope.Auto, [], self.interface, self.comments, self.scope)
+        visitor.visit_Module(module)
+        self.scan()
+        self.parseModDecls()
+        self.parseStatements(self.events)
+        self.events = None
+        if self.lazy_places:
+            self.collect_comments()
+        self.check_unknown()
+        self.expect(Tokens.EOF)
+        events.flush()
+        for auto in module.Auto:
+            auto.visit(visitor)
+        for line in sorted(module.Comments):
+            visitor.visit_Comment(module.Comments[line])
+        visitor.leave_Module(module)
+        return module
+
+    def parse_interface(self) -> List[ast.Item]:
+        """
+        Быстрый разбор только объявлений модуля: переменных, сигнатур методов
+        и инструкций препроцессора (в т.ч. областей) между ними.
+        Тела методов пропускаются, операторы модуля не разбираются.
+        Возвращает экспортные переменные и методы модуля (как ast.Module.Interface).
+        """
+        self.skip_bodies = True
+        self.open_scope()
+        self.methods = self.scope.Methods
+        self.scan()
+        self.parseModDecls()
+        return self.interface.copy()
+
+    def parseModule(self) -> ast.Module:
         self.open_scope()
         self.methods = self.scope.Methods
         self.scan()
         decls = self.parseModDecls()
         statements = self.parseStatements()
         auto = self.scope.Auto.copy()
+        if self.lazy_places:
+            self.collect_comments()
         module = ast.Module(
             decls,
             auto,
             statements,
             self.interface.copy(),
-            self.comments.copy()
+            self.comments.copy(),
+            self.scope
         )
+        return module
+
+    def check_unknown(self):
         for name in self.unknown:
             item = self.unknown[name]
             places = self.callsites[item]
@@ -453,91 +1096,207 @@ class Parser:
                     f'Undeclared method "{item.Name}"',
                     Marker(place.BegPos, place.BegLine, place.BegColumn)
                 )
-        self.expect(Tokens.EOF)
-        return module
-
-    def parseExpression(self) -> ast.Expr:
-        marker = self.marker()
-        expr = self.parseAndExpr()
-        while self.tok == Keywords.OR:
-            operator = self.tok
-            self.scan()
-            expr = ast.BinaryExpr(
-                expr,
-                operator,
-                self.parseAndExpr(),
-                self.place_from(marker)
-            )
-        return expr
 
-    def parseAndExpr(self) -> ast.Expr:
-        marker = self.marker()
-        expr = self.parseNotExpr()
-        while self.tok == Keywords.AND:
-            operator = self.tok
-            self.scan()
-            expr = ast.BinaryExpr(
-                expr,
-                operator,
-                self.parseNotExpr(),
-                self.place_from(marker)
-            )
-        return expr
-
-    def parseNotExpr(self) -> ast.Expr:
-        marker = self.marker()
-        expr: ast.Expr
-        if self.tok == Keywords.NOT:
-            self.scan()
-            expr = ast.NotExpr(
-                self.parseRelExpr(),
-                self.place_from(marker)
-            )
+    def reparse(self, module: ast.Module, edit: Edit) -> ast.Module:
+        """
+        Повторный разбор модуля после правки текста.
+        self.src - текст после правки, module - результат разбора текста до правки.
+        Если правка не выходит за пределы тела одного метода, то заново разбирается только этот метод.
+        Новый MethodDecl подставляется вместо прежнего, а места узлов и комментариев за методом
+        сдвигаются (узлы прежнего модуля за методом изменяются на месте).
+        Ошибки в self.errors в этом случае относятся только к разобранному методу.
+        Если правка затрагивает объявления уровня модуля, сигнатуру метода или области препроцессора,
+        а также если метод не удалось разобрать отдельно, выполняется полный разбор.
+        """
+        if module.Scope is None:
+            return self.parse()
+        index = find_method_decl(module.Decls, edit)
+        if index is None:
+            return self.parse()
+        old_decl = module.Decls[index]
+        assert isinstance(old_decl, ast.MethodDecl)
+        if contains_regions(old_decl.Body):
+            return self.parse()
+        delta = len(edit.text) - (edit.end - edit.pos)
+        parser = Parser(self.src, lexer=self.lexer, lazy_places=self.lazy_places)
+        try:
+            decl = parser.reparseMethodDecl(old_decl, module.Scope)
+        except ParserException:
+            return self.parse()
+        if decl.Place.EndPos != old_decl.Place.EndPos + delta or contains_regions(decl.Body):
+            return self.parse()
+        if self.lazy_places:
+            parser.collect_comments()
+        parser.check_unknown()
+        self.errors.extend(parser.errors)
+        return parser.splice(module, index, decl, delta)
+
+    def reparseMethodDecl(self, old: ast.MethodDecl, module_scope: ast.Scope) -> ast.MethodDecl:
+        """
+        Разбирает тело метода заново, сохраняя прежнюю сигнатуру.
+        Метод видит переменные модуля (без автоматических из тела модуля) и все методы модуля.
+        """
+        sign = old.Sign
+        place = sign.Place
+        # текст до конца сигнатуры не изменился, сканер встает сразу за ней
+        self.cur_pos = place.EndPos
+        self.cur_line = place.EndLine
+        self.line_pos = place.EndPos - place.EndColumn
+        self.char = self.src[self.cur_pos:self.cur_pos+1]
+        self.lit = ''
+        outer = ast.Scope(module_scope.Outer)
+        for name, item in module_scope.Vars.items():
+            if not isinstance(item.Decl, ast.AutoDecl):
+                outer.Vars[name] = item
+        outer.Methods = module_scope.Methods
+        self.scope = outer
+        self.vars = outer.Vars
+        self.methods = outer.Methods
+        self.is_func = isinstance(sign, ast.FuncSign)
+        self.directive = sign.Directive
+        marker: Union[Marker, int]
+        if self.lazy_places:
+            marker = old.Place.BegPos
         else:
-            expr = self.parseRelExpr()
-        return expr
-
-    def parseRelExpr(self) -> ast.Expr:
-        marker = self.marker()
-        expr = self.parseAddExpr()
-        while self.tok in rel_operators:
-            operator = self.tok
-            self.scan()
-            expr = ast.BinaryExpr(
-                expr,
-                operator,
-                self.parseAddExpr(),
-                self.place_from(marker)
-            )
-        return expr
+            marker = Marker(old.Place.BegPos, old.Place.BegLine, old.Place.BegColumn)
+        self.scan()
+        self.open_scope()
+        for param in sign.Params:
+            self.vars[param.Name.lower()] = ast.Item(param.Name, param)
+        var_list = self.parseVars()
+        body = self.parseStatements()
+        if self.is_func:
+            self.expect(Keywords.ENDFUNCTION)
+        else:
+            self.expect(Keywords.ENDPROCEDURE)
+        auto: List[ast.AutoDecl] = []
+        for auto_decl in self.scope.Auto:
+            auto.append(auto_decl)
+        self.close_scope()
+        self.scan()
+        decl = ast.MethodDecl(
+            sign,
+            var_list,
+            auto,
+            body,
+            self.place_from(marker)
+        )
+        return decl
 
-    def parseAddExpr(self) -> ast.Expr:
-        marker = self.marker()
-        expr = self.parseMulExpr()
-        while self.tok in add_operators:
-            operator = self.tok
-            self.scan()
-            expr = ast.BinaryExpr(
-                expr,
-                operator,
-                self.parseMulExpr(),
-                self.place_from(marker)
-            )
-        return expr
+    def splice(self, module: ast.Module, index: int, decl: ast.MethodDecl, delta: int) -> ast.Module:
+        """
+        Собирает модуль с заново разобранным методом decl вместо module.Decls[index].
+        Места узлов и комментариев за методом сдвигаются на delta символов.
+        """
+        old_place = module.Decls[index].Place
+        old_end = old_place.EndPos
+        if self.lazy_places:
+            lines = self.lines
+            def shift(place):
+                place.BegPos += delta
+                place.EndPos += delta
+                place.Lines = lines
+            def shift_comment(comment):
+                line, column = lines.position(comment.pos + delta)
+                return ast.Comment(comment.text, comment.pos + delta, line, column)
+        else:
+            # строки за концом метода сдвигаются целиком, а на строке конца метода меняются и колонки
+            end_line = old_place.EndLine
+            dlines = decl.Place.EndLine - end_line
+            dcolumn = decl.Place.EndColumn - old_place.EndColumn
+            def shift(place):
+                if place.BegLine == end_line:
+                    place.BegColumn += dcolumn
+                if place.EndLine == end_line:
+                    place.EndColumn += dcolumn
+                place.BegLine += dlines
+                place.EndLine += dlines
+                place.BegPos += delta
+                place.EndPos += delta
+            def shift_comment(comment):
+                column = comment.column + dcolumn if comment.line == end_line else comment.column
+                return ast.Comment(comment.text, comment.pos + delta, comment.line + dlines, column)
+        decls = module.Decls.copy()
+        decls[index] = decl
+        shift_places(decls[index+1:], shift)
+        shift_places(module.Auto, shift)
+        shift_places(module.Body, shift)
+        sign_end = decl.Sign.Place.EndPos
+        comments: Dict[int, ast.Comment] = {}
+        for line, comment in module.Comments.items():
+            if comment.pos < sign_end:
+                comments[line] = comment
+        for line, comment in self.comments.items():
+            if comment.pos < decl.Place.EndPos:
+                comments[line] = comment
+        for comment in module.Comments.values():
+            if comment.pos >= old_end:
+                comment = shift_comment(comment)
+                comments[comment.line] = comment
+        result = ast.Module(
+            decls,
+            module.Auto,
+            module.Body,
+            module.Interface,
+            comments,
+            module.Scope
+        )
+        if self.node_index:
+            result.Index = bsl.index.build(result)
+        return result
 
-    def parseMulExpr(self) -> ast.Expr:
-        marker = self.marker()
-        expr = self.parseUnaryExpr()
-        while self.tok in mul_operators:
+    def parseExpression(self) -> ast.Expr:
+        """
+        Разбор выражения методом предшествования операторов с явным стеком.
+        Строит те же деревья, что и грамматика:
+        Expr := And {Или And}
+        And := Not {И Not}
+        Not := [Не] Rel
+        Rel := Add {RelOp Add}
+        Add := Mul {AddOp Mul}
+        Mul := Unary {MulOp Unary}
+        Unary := [AddOp] Operand
+        Бинарные операторы левоассоциативны; начало бинарного узла совпадает с началом левого операнда.
+        """
+        # элементы стека: (приоритет, оператор, левый операнд, маркер начала)
+        stack: List[Tuple[int, Union[Tokens, Keywords], Optional[ast.Expr], Marker]] = []
+        expr: ast.Expr
+        while True:
+            marker = self.marker()
+            if self.tok == Keywords.NOT and (not stack or stack[-1][0] <= PREC_AND):
+                stack.append((PREC_NOT, Keywords.NOT, None, marker))
+                self.scan()
+                marker = self.marker()
             operator = self.tok
+            if operator in add_operators:
+                self.scan()
+                expr = ast.UnaryExpr(
+                    operator,
+                    self.parseOperand(),
+                    self.place_from(marker)
+                )
+            else:
+                assert operator != Tokens.EOF
+                expr = self.parseOperand()
+            prec = binary_operators.get(self.tok, 0)
+            while stack and stack[-1][0] >= prec:
+                top_prec, top_operator, left, marker = stack.pop()
+                if left is None:
+                    expr = ast.NotExpr(
+                        expr,
+                        self.place_from(marker)
+                    )
+                else:
+                    expr = ast.BinaryExpr(
+                        left,
+                        top_operator,
+                        expr,
+                        self.place_from(marker)
+                    )
+            if prec == 0:
+                return expr
+            stack.append((prec, self.tok, expr, marker))
             self.scan()
-            expr = ast.BinaryExpr(
-                expr,
-                operator,
-                self.parseUnaryExpr(),
-                self.place_from(marker)
-            )
-        return expr
 
     def parseUnaryExpr(self) -> ast.Expr:
         marker = self.marker()
@@ -563,8 +1322,9 @@ class Parser:
         elif tok in basic_lit_no_string:
             operand = ast.BasicLitExpr(
                 tok,
-                self.val,
-                self.place()
+                self.value,
+                self.place(),
+                self.lit
             )
             self.scan()
         elif tok == Tokens.IDENT:
@@ -585,8 +1345,9 @@ class Parser:
         def append_this():
             expr = ast.BasicLitExpr(
                 self.tok,
-                self.val,
-                self.place()
+                None,
+                self.place(),
+                self.lit
             )
             expr_list.append(expr)
         while True:
@@ -687,7 +1448,9 @@ class Parser:
         while True:
             if self.tok == Tokens.PERIOD:
                 self.scan()
-                if not self.lit[0:1].isalpha() or Keywords.get(self.lit) is None:
+                tok = self.tok
+                if (tok is not Tokens.IDENT and not isinstance(tok, Keywords)
+                    and (not self.lit[0:1].isalpha() or Keywords.get(self.lit) is None)):
                     self.expect(Tokens.IDENT)
                 name = self.lit
                 if self.scan() == Tokens.LPAREN:
@@ -710,7 +1473,7 @@ class Parser:
             elif self.tok == Tokens.LBRACK:
                 call = False
                 if self.scan() == Tokens.RBRACK:
-                    raise UnexpectedSyntax('Expression expected', marker)
+                    raise UnexpectedSyntax('Expression expected', self.locate(marker))
                 index = self.parseExpression()
                 self.expect(Tokens.RBRACK)
                 self.scan()
@@ -776,7 +1539,7 @@ class Parser:
         return paren_expr
 
     def parseModDecls(self) -> List[ast.Decl]:
-        decls: List[ast.Decl] = []
+        decls: List[ast.Decl] = [] if self.events is None else self.events  # type: ignore
         while isinstance(self.tok, Directives):
             self.directive = self.tok
             self.scan()
@@ -854,7 +1617,7 @@ class Parser:
             self.place_from(marker)
         )
         if self.vars.get(name_lower) is not None:
-            raise AlreadyDeclared('Identifier already declared', marker)
+            raise AlreadyDeclared('Identifier already declared', self.locate(marker))
         item = ast.Item(name, decl)
         self.vars[name_lower] = item
         if export:
@@ -883,7 +1646,7 @@ class Parser:
             self.place()
         )
         if self.vars.get(name_lower) is not None:
-            raise AlreadyDeclared("Identifier already declared", marker)
+            raise AlreadyDeclared("Identifier already declared", self.locate(marker))
         self.vars[name_lower] = ast.Item(name, decl)
         self.scan()
         return decl
@@ -924,12 +1687,18 @@ class Parser:
         else:
             item = ast.Item(name, sign)
         if self.find_method(name_lower) is not None:
-            raise AlreadyDeclared('Method already declared', marker)
+            raise AlreadyDeclared('Method already declared', self.locate(marker))
         self.methods[name_lower] = item
         if export:
             self.interface.append(item)
-        var_list = self.parseVars()
-        body = self.parseStatements()
+        var_list: List[ast.Decl]
+        body: List[ast.Stmt]
+        if self.skip_bodies:
+            var_list, body = [], []
+            self.skipMethodBody()
+        else:
+            var_list = self.parseVars()
+            body = self.parseStatements()
         if self.is_func:
             self.expect(Keywords.ENDFUNCTION)
         else:
@@ -948,6 +1717,31 @@ class Parser:
         )
         return decl
 
+    def skipMethodBody(self):
+        """
+        Пропускает тело метода до ближайшего КонецПроцедуры или КонецФункции
+        (не после точки, вне строк и комментариев). Комментарии тела не собираются.
+        Сканер встает на найденное ключевое слово.
+        """
+        src = self.src
+        beg = self.beg_pos
+        pos = len(src)
+        search = method_end_re.search
+        m = search(src, beg)
+        while m is not None:
+            if m.lastindex:
+                pos = m.start()
+                break
+            m = search(src, m.end())
+        self.cur_line = self.beg_line + src.count('\n', beg, pos)
+        line_pos = src.rfind('\n', beg, pos)
+        if line_pos >= 0:
+            self.line_pos = line_pos + 1
+        self.cur_pos = pos
+        self.char = src[pos:pos+1]
+        self.lit = ''
+        self.scan()
+
     def ParseParams(self) -> List[ast.Decl]:
         self.expect(Tokens.LPAREN)
         self.scan()
@@ -987,12 +1781,12 @@ class Parser:
                 self.place_from(marker)
             )
         if self.vars.get(name_lower):
-            raise AlreadyDeclared('Identifier already declared', marker)
+            raise AlreadyDeclared('Identifier already declared', self.locate(marker))
         self.vars[name_lower] = ast.Item(name, decl)
         return decl
 
-    def parseStatements(self) -> List[ast.Stmt]:
-        statements: List[ast.Stmt] = []
+    def parseStatements(self, events: Optional[Events] = None) -> List[ast.Stmt]:
+        statements: List[ast.Stmt] = [] if events is None else events  # type: ignore
         stmt = self.parseStmt()
         if stmt is not None:
             statements.append(stmt)
@@ -1397,8 +2191,7 @@ class Parser:
     def parsePrepElseInst(self) -> ast.PrepInst:
         marker = self.marker()
         self.tok = Tokens.SEMICOLON  # cheat code
-        self.end_line = self.cur_line  # cheat code
-        self.end_column = self.cur_pos - self.line_pos  # cheat code
+        self.end_here()  # cheat code
         inst = ast.PrepElseInst(
             self.place_from(marker)
         )
@@ -1407,8 +2200,7 @@ class Parser:
     def parsePrepEndIfInst(self) -> ast.PrepInst:
         marker = self.marker()
         self.tok = Tokens.SEMICOLON  # cheat code
-        self.end_line = self.cur_line  # cheat code
-        self.end_column = self.cur_pos - self.line_pos  # cheat code
+        self.end_here()  # cheat code
         inst = ast.PrepEndIfInst(
             self.place_from(marker)
         )
@@ -1429,8 +2221,7 @@ class Parser:
     def parsePrepEndRegionInst(self) -> ast.PrepInst:
         marker = self.marker()
         self.tok = Tokens.SEMICOLON  # cheat code
-        self.end_line = self.cur_line  # cheat code
-        self.end_column = self.cur_pos - self.line_pos  # cheat code
+        self.end_here()  # cheat code
         inst = ast.PrepEndRegionInst(
             self.place_from(marker)
         )
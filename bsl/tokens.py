@@ -0,0 +1,77 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Плагины уровня токенов.
+
+Такому плагину не нужно дерево: он объявляет хуки
+    visit_Token(self, tok, lit, pos, line, column) - для каждого токена (кроме EOF),
+    visit_Comment(self, comment: ast.Comment) - для каждого комментария в порядке строк,
+и получает их прямо от сканера (см. bsl.parser.tokenize). Если у модуля все плагины
+уровня токенов, модуль не разбирается. Токены до лексической ошибки передаются плагинам,
+а комментарии передаются и для модулей с синтаксическими ошибками. Если токены не нужны
+ни одному плагину, комментарии находятся без токенизации (см. bsl.parser.scan_comments).
+"""
+
+from typing import List, Dict, Optional
+from bsl.enums import Tokens
+from bsl.parser import tokenize, scan_comments, token_kinds
+from bsl.visitor import Visitor, hook_failed
+import bsl.ast as ast
+import bsl.index
+from plugins import Plugin
+from output.timings import Timings, timed
+
+token_hooks = ('visit_Token', 'visit_Comment')
+
+def has_token_hooks(plugin: Plugin) -> bool:
+    return any(callable(getattr(plugin, name, None)) for name in token_hooks)
+
+def is_token_level(plugin: Plugin) -> bool:
+    """ плагину не нужно дерево: есть хуки токенов и нет хуков визитера и запросов к индексу """
+    if not has_token_hooks(plugin) or bsl.index.is_query(plugin):
+        return False
+    table = Visitor.hook_table((type(plugin),))
+    return not any(indices for name, indices in table.items() if name not in token_hooks)
+
+def run(src: str, plugins: List[Plugin], comments: Optional[Dict[int, ast.Comment]] = None,
+        timings: Optional[Timings] = None):
+    """
+    Передает токены и комментарии модуля плагинам с хуками токенов.
+    comments - комментарии уже разобранного модуля (плагинам передаются они).
+    Если токены не нужны ни одному плагину, сканер не запускается, а комментарии
+    без comments находятся функцией scan_comments.
+    """
+    hooks: Dict[str, list] = {name: [] for name in token_hooks}
+    for plugin in plugins:
+        for name in token_hooks:
+            if callable(getattr(plugin, name, None)):
+                hooks[name].append(getattr(plugin, name) if timings is None else timed(plugin, name, timings))
+    token_hooks_ = hooks['visit_Token']
+    if token_hooks_:
+        buf = tokenize(src)
+        if comments is None:
+            comments = buf.comments
+        kinds, begs, lines, columns = buf.kinds, buf.begs, buf.lines, buf.columns
+        for index in range(len(buf)):
+            tok = token_kinds[kinds[index]]
+            if tok is Tokens.EOF:
+                break
+            lit = buf.lit(index)
+            pos, line, column = begs[index], lines[index], columns[index]
+            for hook in token_hooks_:
+                try:
+                    hook(tok, lit, pos, line, column)
+                except Exception as e:
+                    hook_failed(e)
+    if not hooks['visit_Comment']:
+        return
+    if comments is None:
+        comments = scan_comments(src)
+    for comment in comments.values():
+        for hook in hooks['visit_Comment']:
+            try:
+                hook(comment)
+            except Exception as e:
+                hook_failed(e)
@@ -2,48 +2,126 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
-from typing import List, Dict, Callable, Any
+from typing import List, Dict, Callable, Any, Tuple, Optional
 from plugins import Plugin
-from collections import defaultdict
+from output.timings import Timings, timed
 
 Node = Any  # ast.Node импортировать нельзя, ибо питон не умеет циклические зависимости
 
+# Таблицы хуков по набору классов плагинов: имя метода визитера -> номера плагинов с этим хуком.
+# Строятся один раз для набора и используются для всех модулей.
+hook_tables: Dict[Tuple[type, ...], Dict[str, List[int]]] = {}
+
+def hook_failed(e: Exception):
+    """ исключение в хуке плагина: плагин пропускает узел (токен, комментарий), обход продолжается """
+    print(e)  # TODO: писать в log
+
+# Виды узлов. Номер вида (атрибут класса узла KindId) - индекс в списке счетчиков визитера.
+kinds = (
+    'Module', 'VarModListDecl', 'VarModDecl', 'VarLocDecl', 'AutoDecl', 'ParamDecl',
+    'MethodDecl', 'ProcSign', 'FuncSign',
+    'BasicLitExpr', 'FieldExpr', 'IndexExpr', 'IdentExpr', 'UnaryExpr', 'BinaryExpr',
+    'NewExpr', 'TernaryExpr', 'ParenExpr', 'NotExpr', 'StringExpr',
+    'AssignStmt', 'ReturnStmt', 'BreakStmt', 'ContinueStmt', 'RaiseStmt', 'ExecuteStmt',
+    'CallStmt', 'IfStmt', 'ElseStmt', 'ElsIfStmt', 'WhileStmt', 'ForStmt', 'ForEachStmt',
+    'TryStmt', 'ExceptStmt', 'GotoStmt', 'LabelStmt',
+    'PrepIfInst', 'PrepElsIfInst', 'PrepElseInst', 'PrepEndIfInst', 'PrepRegionInst', 'PrepEndRegionInst',
+    'PrepBinaryExpr', 'PrepNotExpr', 'PrepSymExpr', 'PrepParenExpr',
+)
+
+# Агрегаты - счетчики после счетчиков видов узлов, которые визитер ведет для всех плагинов:
+LOOP_DEPTH = len(kinds)      # вложенность циклов (Пока, Для, Для Каждого)
+TRY_DEPTH = len(kinds) + 1   # вложенность блоков Попытка (без блоков Исключение)
+COUNTERS = len(kinds) + 2
+
+# Вклад узлов в агрегаты: вид узла -> ((номер агрегата, приращение), ...)
+aggregates: Dict[str, Tuple[Tuple[int, int], ...]] = {
+    'WhileStmt': ((LOOP_DEPTH, 1),),
+    'ForStmt': ((LOOP_DEPTH, 1),),
+    'ForEachStmt': ((LOOP_DEPTH, 1),),
+    'TryStmt': ((TRY_DEPTH, 1),),
+    'ExceptStmt': ((TRY_DEPTH, -1),),
+}
+
+# То же по номерам видов (для push/pop)
+kind_aggregates: List[Tuple[Tuple[int, int], ...]] = [aggregates.get(kind, ()) for kind in kinds]
+
+def ignore(node):
+    """ заменяет методы визитера для узлов, на которые не подписан ни один плагин """
+
 class Visitor:
 
-    def __init__(self, plugins: List[Plugin]):
+    # Узлы, у которых есть leave_, но которые не помещаются в стек
+    unstacked = ('Expr', 'PrepExpr')
+
+    def __init__(self, plugins: List[Plugin], timings: Optional[Timings] = None):
+        """ если передан словарь timings, в него собирается хронометраж хуков (см. output.timings) """
 
-        methods = [func for func in dir(self)
-                            if callable(getattr(self, func))
-                                and (func.startswith("visit_")
-                                     or func.startswith("leave_"))]
+        table = self.hook_table(tuple(type(plugin) for plugin in plugins))
 
         self.hooks: Dict[str, List[Callable]] = {}
 
-        for name in methods:
-            hooks: List[Callable] = []
+        for name, indices in table.items():
+            if timings is None:
+                hooks = [getattr(plugins[index], name) for index in indices]
+            else:
+                hooks = [timed(plugins[index], name, timings) for index in indices]
             self.hooks[name] = hooks
-            for plugin in plugins:
-                if hook := getattr(plugin, name, None):
-                    hooks.append(hook)
+            if not hooks:
+                # без подписчиков остается только работа со стеком
+                stacked = 'leave_' + name[6:] in table and name[6:] not in self.unstacked
+                if not stacked:
+                    setattr(self, name, ignore)
+                elif name.startswith('visit_'):
+                    setattr(self, name, self.push)
+                else:
+                    setattr(self, name, self.leave)
 
         self.stack: List[Node] = []
-        self.counters: Dict[type, int] = defaultdict(int)
+        self.counters: List[int] = [0] * COUNTERS
+
+    @classmethod
+    def hook_table(cls, classes: Tuple[type, ...]) -> Dict[str, List[int]]:
+        key = (cls, *classes)
+        table = hook_tables.get(key)
+        if table is None:
+            names = [name for name in dir(cls)
+                            if callable(getattr(cls, name))
+                                and (name.startswith("visit_")
+                                     or name.startswith("leave_"))]
+            table = {}
+            for name in names:
+                table[name] = [index for index, plugin_class in enumerate(classes)
+                                     if getattr(plugin_class, name, None)]
+            hook_tables[key] = table
+        return table
 
     def push(self, node):
-        self.counters[type(node)] += 1
+        kind = node.KindId
+        self.counters[kind] += 1
+        if kind_aggregates[kind]:
+            for index, delta in kind_aggregates[kind]:
+                self.counters[index] += delta
         self.stack.append(node)
 
     def pop(self) -> Node:
         node = self.stack.pop()
-        self.counters[type(node)] -= 1
+        kind = node.KindId
+        self.counters[kind] -= 1
+        if kind_aggregates[kind]:
+            for index, delta in kind_aggregates[kind]:
+                self.counters[index] -= delta
         return node
 
+    def leave(self, node):
+        assert node is self.pop()
+
     def perform(self, func_name, node):
         for hook in self.hooks[func_name]:
             try:
                 hook(node, self.stack, self.counters)
             except Exception as e:
-                print(e)  # TODO: писать в log
+                hook_failed(e)
 
 
     # Module
@@ -56,6 +134,16 @@ class Visitor:
         assert node is self.pop()
         self.perform('leave_Module', node)
 
+    # Comment - хук уровня токенов (см. bsl.tokens): комментарии модуля в порядке строк
+    # передаются перед leave_Module
+
+    def visit_Comment(self, comment):
+        for hook in self.hooks['visit_Comment']:
+            try:
+                hook(comment)
+            except Exception as e:
+                hook_failed(e)
+
     # VarModListDecl
 
     def visit_VarModListDecl(self, node):
@@ -2,12 +2,17 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
-from typing import List, Optional
+from typing import List, Dict, Optional
 
 from md.base import XMLParser
 import md.conf as cf
 import md.visitor
-import bsl.visitor
+import md.schedule
+import md.manifest
+import bsl.index
+import bsl.tokens
+import bsl.cache
+import bsl.parallel
 import bsl.ast as ast
 from bsl.parser import Parser
 
@@ -17,79 +22,236 @@ import plugins.bsl.errors as errors
 from plugins.md.conf.translation import DocumentStandardAttributes
 from plugins.md.conf.rights import InteractiveDelete
 import reports.sonar as sonar
+from output.timings import Timings, merge, report
+from output.progress import Progress
 
 import time
 import concurrent.futures
+import queue
 import os.path
+import sys
 
-def parse(module):
+# хронометраж хуков плагинов: python main.py --timings
+TIMINGS = '--timings' in sys.argv
+
+# анализ всех модулей без учета манифеста прошлого запуска: python main.py --full
+FULL = '--full' in sys.argv
+
+# кеш разобранных модулей на диске (см. bsl.cache): python main.py --ast-cache
+AST_CACHE = "C:/dev/sonarqube/myprj/bsl-ast-cache" if '--ast-cache' in sys.argv else None
+
+PLUGINS = (
+    comments.ClosingComments,
+    comments.CommentedOutCode,
+    warnings.UnusedVariables,
+    warnings.EmptyExcept,
+    warnings.Concatenation,
+    warnings.StructureConstructor,
+    errors.DuplicateConditions,
+)
+
+def parse(module, timed=False):
+    """
+    Возвращает результаты плагинов и их хронометраж (если timed).
+    Модуль не разбирается, если все плагины уровня токенов (см. bsl.tokens).
+    Если модуль не удалось разобрать, возвращаются результаты только плагинов уровня токенов.
+    """
     if os.path.isfile(module.path):
         with open(module.path, 'r', encoding='utf-8-sig') as f:
             src = f.read()
-            parser = Parser(src, module.scope)
+        plugins = [plugin(module.path, src) for plugin in PLUGINS]
+        timings: Optional[Timings] = {} if timed else None
+        done = [p for p in plugins if bsl.tokens.is_token_level(p)]
+        parsed = False
+        if len(done) < len(plugins):
+            parser = Parser(src, module.scope, lazy_places=True)
             try:
                 ast = parser.parse()
-                plugins = [
-                    comments.ClosingComments(module.path, src),
-                    comments.CommentedOutCode(module.path, src),
-                    warnings.UnusedVariables(module.path, src),
-                    warnings.EmptyExcept(module.path, src),
-                    warnings.Concatenation(module.path, src),
-                    warnings.StructureConstructor(module.path, src),
-                    errors.DuplicateConditions(module.path, src),
-                ]
-                visitor = bsl.visitor.Visitor(plugins)
-                ast.visit(visitor)
-                results = [p.close().items for p in plugins]
-                return results
+                # комментарии разобранного модуля передаются обходом дерева
+                bsl.index.run(ast, plugins, timings)
+                parsed = True
+                done = plugins
             except Exception as e:
                 print(module.path)
                 print(e)
+        if parsed:
+            bsl.tokens.run(src, [p for p in done if callable(getattr(p, 'visit_Token', None))], {}, timings)
+        else:
+            bsl.tokens.run(src, [p for p in done if bsl.tokens.has_token_hooks(p)], None, timings)
+        results = [p.close().items for p in done]
+        return results, timings
+    return None, None
+
+def parse_part(module, part, timed=False):
+    """
+    Результаты плагинов по части part = (номер, число частей) модуля (см. bsl.parallel)
+    в порядке PLUGINS и их хронометраж. None вместо результата - плагин в этой части не выполнялся
+    из-за ошибки разбора. Плагины уровня токенов выполняются в части 0 по всему модулю.
+    """
+    number, count = part
+    with open(module.path, 'r', encoding='utf-8-sig') as f:
+        src = f.read()
+    plugins = [plugin(module.path, src) for plugin in PLUGINS]
+    timings: Optional[Timings] = {} if timed else None
+    tokens = [p for p in plugins if bsl.tokens.is_token_level(p)]
+    tree = [p for p in plugins if not bsl.tokens.is_token_level(p)]
+    done = tokens if number == 0 else []
+    try:
+        ast = bsl.parallel.parse(src, module.scope, number, count)
+        bsl.index.run(ast, tree, timings)
+        done = done + tree
+    except Exception as e:
+        print(module.path)
+        print(e)
+    if number == 0:
+        bsl.tokens.run(src, tokens, None, timings)
+        bsl.tokens.run(src, [p for p in done if p in tree and callable(getattr(p, 'visit_Token', None))], {}, timings)
+    results = [
+        p.close().items if p in done else [] if p in tokens else None
+        for p in plugins
+    ]
+    return results, timings
+
+def init_worker(scopes, ast_cache):
+    """ инициализация воркера: общие области видимости (см. md.visitor.share) и кеш разобранных модулей """
+    md.visitor.share(scopes)
+    if ast_cache is not None:
+        bsl.cache.enable(ast_cache)
+
+def parse_batch(batch, timed=False, part=None):
+    """
+    parse() для пакета модулей (см. md.schedule); для каждого модуля возвращает еще и время анализа.
+    Если задана часть part, пакет состоит из одного модуля, и анализируется только эта часть (см. parse_part).
+    """
+    output = []
+    for module in batch:
+        strt = time.perf_counter()
+        if part is None:
+            results, timings = parse(module, timed)
+        else:
+            results, timings = parse_part(module, part, timed)
+        output.append((module.path, results, timings, time.perf_counter() - strt))
+    return output
 
 
 def main():
 
-    issues = []
+    timings: Timings = {}
 
     strt = time.perf_counter()
 
-    path = "C:/dev/sonarqube/myprj/src/Configuration.xml"
-    plugins = [
-        DocumentStandardAttributes(),
-        InteractiveDelete(),
-    ]
-    root = XMLParser(path, cf.Root).parse()
-    visitor = md.visitor.Visitor(plugins)
-    mdo: Optional[cf.MetaDataObject] = root.MetaDataObject
-    if mdo is not None and mdo.Configuration is not None:
-        mdo.Configuration.visit(visitor)
+    # оценки стоимости модулей - по прошлым запускам (см. md.schedule)
+    costs_path = "C:/dev/sonarqube/myprj/bsl-costs.json"
+    costs = md.schedule.load(costs_path)
 
-    results = [p.close().items for p in plugins]
-    for result in results:
-        for issue in result:
-            issues.append(issue)
+    # модули, текст и область видимости которых не изменились, не анализируются (см. md.manifest);
+    # версия учитывает исходные тексты плагинов и парсера
+    manifest = md.manifest.Manifest("C:/dev/sonarqube/myprj/bsl-manifest.json", md.manifest.version(PLUGINS), FULL)
 
-    print('md time: ', time.perf_counter() - strt)
+    # модули передаются в пул еще во время обхода метаданных, как только их области видимости окончательны,
+    # а результаты обрабатываются в порядке готовности и сразу пишутся в отчет
+    executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+    futures: Dict[concurrent.futures.Future, md.schedule.Batch] = {}
+    completed: queue.SimpleQueue = queue.SimpleQueue()
+    progress = Progress(0, 0.0)
 
-    # -------------------------------------------------------------------------
+    def submit(batch: md.schedule.Batch):
+        nonlocal executor
+        if executor is None:
+            # глобальная область и область конфигурации передаются воркерам один раз, а не с каждым модулем
+            scopes = visitor.shared or []
+            md.visitor.share(scopes)
+            executor = concurrent.futures.ProcessPoolExecutor(initializer=init_worker, initargs=(scopes, AST_CACHE))
+        future = executor.submit(parse_batch, batch.modules, TIMINGS, batch.part)
+        futures[future] = batch
+        future.add_done_callback(completed.put)
 
-    strt = time.perf_counter()
+    def collect(block: bool):
+        while futures and (block or not completed.empty()):
+            future = completed.get()
+            batch = futures.pop(future)
+            for path, results, module_timings, seconds in future.result():
+                if module_timings:
+                    merge(timings, module_timings)
+                if batch.part is not None:
+                    received = parts.setdefault(path, [])
+                    received.append((results, seconds))
+                    if len(received) < batch.part[1]:
+                        continue
+                    del parts[path]
+                    results = bsl.parallel.merge([part_results for part_results, _ in received])
+                    seconds = sum(part_seconds for _, part_seconds in received)
+                costs[path] = seconds
+                if results is not None:
+                    manifest.update(path, [issue for result in results for issue in result])
+                    for result in results:
+                        writer.write(result)
+            progress.advance(md.schedule.counted(batch), batch.cost)
+            pending.done()
+
+    def put(batch: md.schedule.Batch):
+        progress.expect(md.schedule.counted(batch), batch.cost)
+        pending.put(batch)
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        results_list = executor.map(parse, visitor.modules)
+    # результаты полученных частей модулей, анализируемых по частям: путь -> [(результаты, время)]
+    parts: Dict[str, list] = {}
+
+    # пакеты передаются в пул по убыванию стоимости (см. md.schedule.Queue);
+    # дорогие модули делятся на части по методам, если это допускают все плагины (см. bsl.parallel)
+    workers = os.cpu_count() or 1
+    pending = md.schedule.Queue(submit, workers * md.schedule.IN_FLIGHT_PER_WORKER)
+    batcher = md.schedule.Batcher(costs, put, split=workers if bsl.parallel.splittable(PLUGINS) else 1)
+
+    def add(module: md.visitor.ModuleFile):
+        issues = manifest.lookup(module)
+        if issues is None:
+            batcher.add(module)
+            collect(block=False)
+        else:
+            writer.write(issues)
 
     with open("C:/dev/sonarqube/myprj/bsl-generic-json.json", 'w', encoding='utf-8') as f:
-        for results in results_list:
-            if results:
-                for result in results:
-                    for issue in result:
-                        issues.append(issue)
-        x = sonar.fromIssues(issues)
-        f.write(x.toJSON())
+        writer = sonar.Writer(f)
+
+        path = "C:/dev/sonarqube/myprj/src/Configuration.xml"
+        plugins = [
+            DocumentStandardAttributes(),
+            InteractiveDelete(),
+        ]
+        root = XMLParser(path, cf.Root).parse()
+        visitor = md.visitor.Visitor(plugins, timings if TIMINGS else None, add)
+        mdo: Optional[cf.MetaDataObject] = root.MetaDataObject
+        if mdo is not None and mdo.Configuration is not None:
+            mdo.Configuration.visit(visitor)
+        if visitor.shared is None:
+            visitor.share_scope()
+        batcher.flush()
+
+        results = [p.close().items for p in plugins]
+        for result in results:
+            writer.write(result)
+
+        print('md time: ', time.perf_counter() - strt)
+
+        # -------------------------------------------------------------------------
+
+        strt = time.perf_counter()
+
+        collect(block=True)
+        if executor is not None:
+            executor.shutdown()
+        writer.close()
+        progress.close()
+
+    md.schedule.save(costs_path, costs)
+    manifest.save()
+
+    print('bsl time (after md): ', time.perf_counter() - strt)
 
-    print('bsl time: ', time.perf_counter() - strt)
+    print('issues count: ', writer.count)
 
-    print('issues count: ', len(issues))
+    if TIMINGS:
+        print(report(timings))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1059,7 +1059,7 @@ class CommonModuleProperties(XMLData):
         if self.Global == enums.Bool.TRUE:
             visitor.global_modules.append(module)
         else:
-            visitor.modules.append(module)
+            visitor.add_module(module)
 
         visitor.visit_CommonModuleProperties(self)
         if self.Synonym is not None:
@@ -1201,23 +1201,32 @@ class ConfigurationChildObjects(XMLData):
         self.visit_Languages(visitor)
         self.visit_Roles(visitor)
         self.visit_CommonModules(visitor)
+
+        # область видимости конфигурации заполняется до обхода документов, чтобы их модули
+        # можно было анализировать сразу (см. Visitor.share_scope)
+        if self.Document:
+            context.DocumentManager.fill(visitor.scope)
+        self.load_interfaces(visitor)
+        visitor.share_scope()
+
         self.visit_Documents(visitor)
         visitor.leave_ConfigurationChildObjects(self)
 
+    def load_interfaces(self, visitor: Visitor):
+        """ добавляет в область видимости конфигурации интерфейсы модуля приложения и глобальных общих модулей """
         dirname = os.path.dirname(self._path)
         module = ModuleFile(
             ModuleKinds.CommonModule,
             os.path.join(dirname, 'Ext/ManagedApplicationModule.bsl'),
             visitor.scope
         )
-        visitor.modules.append(module)
+        visitor.add_module(module)
 
         with open(module.path, 'r', encoding='utf-8-sig') as f:
             s = f.read()
             p = Parser(s, module.scope)
             try:
-                m = p.parse()
-                for item in m.Interface:
+                for item in p.parse_interface():
                     if isinstance(item.Decl, VarModDecl):
                         visitor.scope.Vars[item.Name.lower()] = item
                     else:
@@ -1230,8 +1239,7 @@ class ConfigurationChildObjects(XMLData):
                 s = f.read()
                 p = Parser(s, module.scope)
                 try:
-                    m = p.parse()
-                    for item in m.Interface:
+                    for item in p.parse_interface():
                         if isinstance(item.Decl, VarModDecl):
                             visitor.scope.Vars[item.Name.lower()] = item
                         else:
@@ -1447,7 +1455,7 @@ class DocumentChildObjects(XMLData):
         context.DocumentObject.fill(scope)
 
         modules_dir = os.path.join(os.path.splitext(self._path)[0], 'Ext')
-        visitor.modules.append(
+        visitor.add_module(
             ModuleFile(
                 ModuleKinds.ObjectModule,
                 os.path.join(modules_dir, 'ObjectModule.bsl'),
@@ -1499,10 +1507,8 @@ class Document(XMLFile):
 
         visitor.close_scope()
 
-        context.DocumentManager.fill(visitor.scope)
-
         modules_dir = os.path.join(os.path.splitext(self._path)[0], 'Ext')
-        visitor.modules.append(
+        visitor.add_module(
             ModuleFile(
                 ModuleKinds.ManagerModule,
                 os.path.join(modules_dir, 'ManagerModule.bsl'),
@@ -258,7 +258,7 @@ class ManagedForm(XMLData):
         visitor.close_scope()
 
         module_dir, _ = os.path.splitext(self._path)
-        visitor.modules.append(
+        visitor.add_module(
             ModuleFile(
                 ModuleKinds.ManagedFormModule,
                 os.path.join(module_dir, 'Module.bsl'),
@@ -0,0 +1,112 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Манифест инкрементального анализа.
+
+Для каждого модуля хранятся хеш исходного текста, отпечаток видимой ему области видимости
+(реквизиты, экспортные методы и переменные глобальных общих модулей, контекст и т.п.)
+и замечания последнего анализа; для всего манифеста - версия набора плагинов и анализатора (см. version).
+Модуль анализируется повторно, только если изменился его текст или отпечаток области видимости,
+например, изменение сигнатуры экспортного метода глобального общего модуля затрагивает модули,
+которые видят область видимости конфигурации, а изменение реквизита документа - только модули этого документа.
+"""
+
+from typing import List, Dict, Optional, Iterable, Set
+import os
+import json
+import hashlib
+import inspect
+from bsl.cache import fingerprint
+from md.visitor import ModuleFile
+from output.issues import Issue, Kind, Severity, Location
+
+# каталог исходных текстов анализатора
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# исходные тексты (относительно ROOT), от которых кроме модулей плагинов зависят замечания
+SOURCES = (
+    'bsl/enums.py', 'bsl/ast.py', 'bsl/glob.py', 'bsl/parser.py', 'bsl/visitor.py',
+    'bsl/fused.py', 'bsl/index.py', 'bsl/tokens.py', 'output/issues.py',
+)
+
+def version(classes: Iterable[type], root: str = ROOT) -> str:
+    """ версия набора плагинов: имена классов, исходные тексты их модулей и SOURCES из каталога root """
+    digest = hashlib.sha1()
+    paths: Set[str] = set()
+    for cls in classes:
+        digest.update(f'{cls.__module__}.{cls.__qualname__};'.encode())
+        path = inspect.getsourcefile(cls)
+        if path is not None:  # класс без исходного текста (например, только .pyc) учитывается по имени
+            paths.add(path)
+    for path in sorted(paths) + [os.path.join(root, name) for name in SOURCES]:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def dump_issue(issue: Issue) -> list:
+    location = issue.location
+    return [issue.kind.name, issue.severity.name, issue.message, issue.effort,
+            location.filepath, location.startLine, location.endLine, location.startColumn, location.endColumn]
+
+def load_issue(data: list) -> Issue:
+    kind, severity, message, effort, *location = data
+    return Issue(Kind[kind], Severity[severity], message, effort, Location(*location))
+
+class Manifest:
+    """
+    Манифест хранится в JSON-файле path. Если версия набора плагинов отличается от version
+    (или передан full), замечания прошлого запуска не используются.
+    В файл сохраняются только модули текущего запуска.
+    """
+
+    def __init__(self, path: str, version: str, full: bool = False):
+        self.path = path
+        self.version = version
+        self.modules: Dict[str, dict] = {}
+        if not full:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == version:
+                    self.modules = data['modules']
+            except (OSError, ValueError, KeyError, AttributeError):
+                pass
+        self.current: Dict[str, dict] = {}
+        self.pending: Dict[str, dict] = {}
+        self.fingerprints: Dict[int, str] = {}
+
+    def lookup(self, module: ModuleFile) -> Optional[List[Issue]]:
+        """
+        Замечания прошлого анализа, если текст модуля и отпечаток его области видимости не изменились.
+        Иначе None: модуль нужно проанализировать и передать замечания в update.
+        """
+        try:
+            stat = os.stat(module.path)
+        except OSError:
+            return None
+        entry = self.modules.get(module.path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            content = entry['hash']
+        else:
+            with open(module.path, 'rb') as f:
+                content = hashlib.sha1(f.read()).hexdigest()
+        scope = fingerprint(module.scope, self.fingerprints)
+        if entry is not None and entry['hash'] == content and entry['scope'] == scope:
+            entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime_ns
+            self.current[module.path] = entry
+            return [load_issue(issue) for issue in entry['issues']]
+        self.pending[module.path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': content, 'scope': scope}
+        return None
+
+    def update(self, path: str, issues: List[Issue]):
+        """ запоминает замечания модуля, для которого lookup вернул None """
+        entry = self.pending.pop(path, None)
+        if entry is not None:
+            entry['issues'] = [dump_issue(issue) for issue in issues]
+            self.current[path] = entry
+
+    def save(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'modules': self.current}, f, ensure_ascii=False)
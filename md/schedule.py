@@ -0,0 +1,148 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Планировщик модулей для пула процессов.
+
+Стоимость модуля оценивается по времени его анализа в прошлых запусках (файл стоимостей),
+а если замера нет - по размеру файла. Модули поступают по одному во время обхода метаданных:
+мелкие собираются в пакеты примерно одинаковой стоимости, чтобы не платить за передачу
+между процессами на каждом модуле (см. Batcher), а пакеты ждут в очереди и отправляются в пул
+по убыванию стоимости, так что дорогие модули, поступившие позже мелких, обгоняют их (см. Queue).
+"""
+
+from typing import List, Dict, Tuple, Callable
+from collections import namedtuple
+import os
+import json
+import heapq
+from md.visitor import ModuleFile
+
+# путь модуля -> время анализа в секундах
+Costs = Dict[str, float]
+
+# пакет модулей и его оценочная стоимость;
+# part - (номер, число частей), если пакет - часть одного модуля, анализируемого по частям (см. bsl.parallel)
+Batch = namedtuple('Batch', 'cost modules part', defaults=(None,))
+
+# секунд на байт исходного текста (разбор и все плагины), если замеров нет
+DEFAULT_RATE = 1e-6
+
+# пакетов на воркер, переданных в пул одновременно (см. Queue): остальные ждут в очереди
+IN_FLIGHT_PER_WORKER = 2
+
+# стоимость пакета в секундах, когда модули поступают по одному (см. Batcher)
+BATCH_COST = 0.1
+
+# наименьшая стоимость части модуля в секундах: модуль делится, если дороже двух частей (см. parts)
+PART_COST = 0.5
+
+def load(path: str) -> Costs:
+    """ стоимости из прошлых запусков (пустой словарь, если файла нет или он испорчен) """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            costs = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return costs if isinstance(costs, dict) else {}
+
+def save(path: str, costs: Costs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(costs, f, ensure_ascii=False)
+
+def size(module: ModuleFile) -> int:
+    try:
+        return os.path.getsize(module.path)
+    except OSError:
+        return 0
+
+def calibrate(costs: Costs) -> float:
+    """ секунды на байт по модулям с замерами (DEFAULT_RATE, если таких нет) """
+    measured_cost = 0.0
+    measured_bytes = 0
+    for path, cost in costs.items():
+        if os.path.isfile(path):
+            measured_cost += cost
+            measured_bytes += os.path.getsize(path)
+    return measured_cost / measured_bytes if measured_bytes else DEFAULT_RATE
+
+def parts(cost: float, limit: int) -> int:
+    """ на сколько частей (не больше limit) делить модуль стоимостью cost; 1 - не делить """
+    return max(1, min(limit, int(cost / PART_COST)))
+
+def counted(batch: Batch) -> int:
+    """ число модулей пакета для прогресса: модуль, анализируемый по частям, учитывается в части 0 """
+    if batch.part is None or batch.part[0] == 0:
+        return len(batch.modules)
+    return 0
+
+class Batcher:
+    """
+    Собирает пакеты из модулей, которые поступают по одному (например, во время обхода метаданных),
+    когда общая стоимость заранее неизвестна. Модуль дороже BATCH_COST передается отдельным пакетом,
+    мелкие копятся в текущем пакете, пока его стоимость не достигнет BATCH_COST.
+    Модуль дороже двух PART_COST передается частями - не больше split пакетов (см. parts).
+    """
+
+    def __init__(self, costs: Costs, submit: Callable[[Batch], None], target: float = BATCH_COST, split: int = 1):
+        self.costs = costs
+        self.rate = calibrate(costs)
+        self.submit = submit
+        self.target = target
+        self.split = split
+        self.batch: List[ModuleFile] = []
+        self.batch_cost = 0.0
+
+    def add(self, module: ModuleFile):
+        cost = self.costs.get(module.path)
+        if cost is None:
+            cost = size(module) * self.rate
+        if cost >= self.target:
+            count = parts(cost, self.split)
+            if count == 1:
+                self.submit(Batch(cost, [module]))
+            else:
+                for part in range(count):
+                    self.submit(Batch(cost / count, [module], (part, count)))
+            return
+        self.batch.append(module)
+        self.batch_cost += cost
+        if self.batch_cost >= self.target:
+            self.flush()
+
+    def flush(self):
+        """ передает текущий пакет, даже если он меньше BATCH_COST """
+        if self.batch:
+            self.submit(Batch(self.batch_cost, self.batch))
+            self.batch = []
+            self.batch_cost = 0.0
+
+class Queue:
+    """
+    Очередь пакетов перед пулом процессов. В пул передается не больше limit пакетов одновременно,
+    остальные ждут и передаются по убыванию стоимости, когда пул сообщает о готовности пакета (done).
+    """
+
+    def __init__(self, submit: Callable[[Batch], None], limit: int):
+        self.submit = submit
+        self.limit = max(limit, 1)
+        self.pending: List[Tuple[float, int, Batch]] = []
+        self.count = 0
+        self.running = 0
+
+    def put(self, batch: Batch):
+        # номер поступления - чтобы пакеты одинаковой стоимости не сравнивались
+        heapq.heappush(self.pending, (-batch.cost, self.count, batch))
+        self.count += 1
+        self.dispatch()
+
+    def done(self):
+        self.running -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        while self.pending and self.running < self.limit:
+            batch = heapq.heappop(self.pending)[2]
+            self.running += 1
+            self.submit(batch)
@@ -3,11 +3,12 @@
 # license that can be found in the LICENSE file.
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Callable
+from typing import List, Dict, Callable, Optional
 from enum import Enum, auto
 from bsl.glob import scope as global_scope
 from bsl.ast import Scope
 from plugins import Plugin
+from output.timings import Timings, timed
 
 class ModuleKinds(Enum):
     ObjectModule = auto()
@@ -15,6 +16,35 @@ class ModuleKinds(Enum):
     ManagedFormModule = auto()
     CommonModule = auto()
 
+# Общие области видимости (глобальная и конфигурации), см. share()
+shared_scopes: List[Scope] = []
+shared_numbers: Dict[int, int] = {}
+
+def share(scopes: List[Scope]):
+    """
+    Регистрирует общие области видимости. Модули передаются процессам-воркерам без них,
+    только с номером общей области, а сами области передаются каждому воркеру один раз:
+        ProcessPoolExecutor(initializer=share, initargs=(scopes,))
+    Вызывается и в основном процессе до передачи модулей.
+    """
+    shared_scopes[:] = scopes
+    shared_numbers.clear()
+    for number, scope in enumerate(scopes):
+        shared_numbers[id(scope)] = number
+
+def chain(scope: Optional[Scope]):
+    while scope is not None:
+        yield scope
+        scope = scope.Outer
+
+def restore(kind, path, scopes, shared):
+    """ восстанавливает модуль, переданный процессу-воркеру (см. ModuleFile.__reduce__) """
+    scope = None if shared is None else shared_scopes[shared]
+    for vars, auto, methods in reversed(scopes):
+        scope = Scope(scope)
+        scope.Vars, scope.Auto, scope.Methods = vars, auto, methods
+    return ModuleFile(kind, path, scope)
+
 class ModuleFile:
 
     def __init__(self, kind, path, scope=None):
@@ -25,9 +55,24 @@ class ModuleFile:
     def __repr__(self):
         return f'{self.kind.name}: {self.path}'
 
+    def __reduce__(self):
+        # сериализуются только собственные области модуля до первой общей (см. share)
+        scopes = []
+        scope = self.scope
+        while scope is not None and id(scope) not in shared_numbers:
+            scopes.append((scope.Vars, scope.Auto, scope.Methods))
+            scope = scope.Outer
+        return restore, (self.kind, self.path, scopes, None if scope is None else shared_numbers[id(scope)])
+
 class Visitor:
 
-    def __init__(self, plugins: List[Plugin]):
+    def __init__(self, plugins: List[Plugin], timings: Optional[Timings] = None,
+                 submit: Optional[Callable[[ModuleFile], None]] = None):
+        """
+        Если передан словарь timings, в него собирается хронометраж хуков (см. output.timings).
+        Если передана функция submit, она вызывается для каждого модуля, как только его область
+        видимости окончательна (см. add_module и share_scope), еще во время обхода метаданных.
+        """
 
         methods = [func for func in dir(self)
                             if callable(getattr(self, func))
@@ -41,13 +86,17 @@ class Visitor:
             self.hooks[name] = hooks
             for plugin in plugins:
                 if hook := getattr(plugin, name, None):
-                    hooks.append(hook)
+                    hooks.append(hook if timings is None else timed(plugin, name, timings))
 
         self.modules: List[ModuleFile] = []
         self.global_modules: List[ModuleFile] = []
 
         self.scope: Scope = global_scope
 
+        self.submit = submit
+        self.held: List[ModuleFile] = []
+        self.shared: Optional[List[Scope]] = None
+
     def perform(self, func_name, node):
         for hook in self.hooks[func_name]:
             try:
@@ -55,6 +104,29 @@ class Visitor:
             except Exception as e:
                 print(e)
 
+    def add_module(self, module: ModuleFile):
+        """
+        Добавляет модуль для анализа. Модуль передается submit сразу, если общие области
+        видимости окончательны, иначе - в share_scope.
+        """
+        self.modules.append(module)
+        if self.submit is not None:
+            if self.shared is None:
+                self.held.append(module)
+            else:
+                self.submit(module)
+
+    def share_scope(self):
+        """
+        Текущая область видимости (конфигурации) и внешние окончательны и становятся общими (self.shared).
+        Отложенные модули передаются submit.
+        """
+        self.shared = list(chain(self.scope))
+        held, self.held = self.held, []
+        if self.submit is not None:
+            for module in held:
+                self.submit(module)
+
     def open_scope(self) -> Scope:
         scope = Scope(self.scope)
         self.scope = scope
@@ -0,0 +1,47 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Прогресс анализа модулей и оценка оставшегося времени.
+Оценка идет по стоимости модулей (см. md.schedule), а не по их числу: модули сильно различаются по размеру.
+"""
+
+from typing import Optional, TextIO
+from time import perf_counter
+import sys
+
+class Progress:
+
+    def __init__(self, total: int, total_cost: float, stream: Optional[TextIO] = None, interval: float = 0.5):
+        """ строка прогресса выводится в stream (по умолчанию stderr) не чаще раза в interval секунд """
+        self.total = total
+        self.total_cost = total_cost
+        self.done = 0
+        self.done_cost = 0.0
+        self.stream = stream
+        self.interval = interval
+        self.start = perf_counter()
+        self.shown = 0.0
+
+    def expect(self, count: int, cost: float):
+        """ учитывает count модулей оценочной стоимостью cost, поступивших на анализ """
+        self.total += count
+        self.total_cost += cost
+
+    def advance(self, count: int, cost: float):
+        """ учитывает count проанализированных модулей оценочной стоимостью cost """
+        self.done += count
+        self.done_cost += cost
+        now = perf_counter()
+        if now - self.shown >= self.interval or self.done >= self.total:
+            self.shown = now
+            print(self.line(now - self.start), end='\r', file=self.stream or sys.stderr)
+
+    def line(self, elapsed: float) -> str:
+        share = min(self.done_cost / self.total_cost, 1.0) if self.total_cost else self.done / max(self.total, 1)
+        eta = f'{elapsed * (1 - share) / share:.0f} s' if share else '?'
+        return f'{self.done}/{self.total} modules ({share:.0%}), elapsed {elapsed:.0f} s, ETA {eta}'
+
+    def close(self):
+        print(file=self.stream or sys.stderr)
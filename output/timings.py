@@ -0,0 +1,48 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""
+Хронометраж хуков плагинов (включается явно, см. параметр timings визитеров).
+Замеры хранятся в словаре: (имя класса плагина, имя хука) -> [число вызовов, суммарное время в нс].
+Ключи - строки, поэтому замеры можно возвращать из процессов-воркеров и складывать.
+"""
+
+from typing import Dict, Tuple, List, Callable, Any
+from time import perf_counter_ns
+
+Timings = Dict[Tuple[str, str], List[int]]
+
+def timed(plugin: Any, name: str, timings: Timings) -> Callable:
+    """ возвращает хук name плагина plugin, который учитывает свои вызовы в timings """
+    hook = getattr(plugin, name)
+    timing = timings.setdefault((type(plugin).__name__, name), [0, 0])
+    def wrapper(*args):
+        start = perf_counter_ns()
+        try:
+            return hook(*args)
+        finally:
+            timing[0] += 1
+            timing[1] += perf_counter_ns() - start
+    return wrapper
+
+def merge(total: Timings, timings: Timings) -> Timings:
+    """ добавляет замеры timings к total """
+    for key, (calls, ns) in timings.items():
+        timing = total.setdefault(key, [0, 0])
+        timing[0] += calls
+        timing[1] += ns
+    return total
+
+def report(timings: Timings, top: int = 20) -> str:
+    """ отчет о самых медленных плагинах и хуках """
+    plugins: Dict[str, int] = {}
+    for (plugin, name), (calls, ns) in timings.items():
+        plugins[plugin] = plugins.get(plugin, 0) + ns
+    lines = ['top slow rules:']
+    for plugin, ns in sorted(plugins.items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append(f'{ns / 1e6:12.1f} ms  {plugin}')
+    lines.append('top slow hooks:')
+    for (plugin, name), (calls, ns) in sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+        lines.append(f'{ns / 1e6:12.1f} ms {calls:10} calls  {plugin}.{name}')
+    return '\n'.join(lines)
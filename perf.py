@@ -4,31 +4,50 @@
 
 """
 Замер производительности анализа файлов *.bsl.
+Вариант сканера для A/B сравнения и папка задаются аргументами: python perf.py CHAR C:/temp/RUERP24
+Кроме времени выводится пиковый объем памяти воркеров (там, где доступен модуль resource).
 """
 
-from bsl.parser import Parser
+from bsl.parser import Parser, Lexers
 from bsl.visitor import Visitor
 
+import os
+import sys
 import time
 import pathlib
 import concurrent.futures
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+lexer = Lexers[sys.argv[1]] if len(sys.argv) > 1 else Lexers.TABLE
+
+def peak_rss() -> int:
+    """
+    Пиковый объем памяти текущего процесса в килобайтах (0, если неизвестен).
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
 def parse(path):
     with open(str(path), 'r', encoding='utf-8-sig') as f:
         s = f.read()
-        p = Parser(s)
+        p = Parser(s, lexer=lexer)
         try:
             AST = p.parse()
             visitor = Visitor([])
             AST.visit(visitor) # обход AST в холостую без плагинов
         except Exception as e:
             print(f"Не удалось разобрать модуль: {path}")
-        return p.cur_line
+        return p.cur_line, os.getpid(), peak_rss()
 
 def main():
 
-    mypath = "C:/temp/RUERP24" # путь к выгрузке конфигурации
-    print(f"Выполняется анализ файлов *.bsl в папке {mypath}...")
+    mypath = sys.argv[2] if len(sys.argv) > 2 else "C:/temp/RUERP24" # путь к выгрузке конфигурации
+    print(f"Выполняется анализ файлов *.bsl в папке {mypath} (сканер {lexer.name})...")
     print("Пожалуйста, дождитесь окончания (это не долго)")
 
     strt = time.perf_counter()
@@ -40,7 +59,16 @@ def main():
 
     print('Время анализа (сек.):', time.perf_counter() - strt)
 
-    print('Строк исходного кода проанализировано:', sum(result))
+    lines = 0
+    peaks = {}
+    for count, pid, rss in result:
+        lines += count
+        peaks[pid] = max(peaks.get(pid, 0), rss)
+
+    print('Строк исходного кода проанализировано:', lines)
+
+    if peaks:
+        print('Пиковая память воркера (МБ):', max(peaks.values()) // 1024)
 
 if __name__ == "__main__":
     main()
@@ -1,4 +1,5 @@
 
+from typing import Optional, Tuple
 from abc import ABC, abstractmethod
 
 class PluginResult:
@@ -6,6 +7,14 @@ class PluginResult:
 
 class Plugin(ABC):
 
+    # замечания плагина не зависят от того, видит ли он методы модуля вместе:
+    # большой модуль можно анализировать по частям в разных процессах (см. bsl.parallel)
+    split: bool = False
+
+    # что хуки узлов плагина читают из контекста обхода: 'stack' и/или 'counters' (см. bsl.visitor).
+    # None - не объявлено: обход проверяет код хуков и при сомнении поддерживает и то, и другое
+    context: Optional[Tuple[str, ...]] = None
+
     @abstractmethod
     def close(self) -> PluginResult:
         pass
\ No newline at end of file
@@ -10,6 +10,9 @@ import os.path
 
 class ClosingComments(IssueCollector):
 
+    split = True
+    context = ()
+
     # TODO: более конкретные сообщения: "Пропущен пробел", "Не хватает скобок" ...
 
     def __init__(self, path, src):
@@ -59,26 +62,29 @@ class ClosingComments(IssueCollector):
 
 class CommentedOutCode(IssueCollector):
 
+    split = True
+    context = ()
+
     def __init__(self, path, src):
 
         self.path = path
         self.src = src
+        self.issue_line = 0
         self.errors: List[Issue] = []
 
     def close(self) -> Issues:
         return Issues(self.errors)
 
-    def visit_Module(self, node: ast.Module, stack, counters):
-        issue_line = 0
-        for line, comment in node.Comments.items():
-            if issue_line == line-1:
-                issue_line = line
-                continue
-            words = comment.text.split(' ')
-            if (len(words) > 1 and words[1] == '=' or words[0] in ['|', '\t'] or enums.Keywords.get(words[0])
-                or len(words) > 0 and words[0][-1:] == ';'):
-                self.issue(f'Возможно комментарий содержит закомментированный код.', comment)
-                issue_line = line
+    def visit_Comment(self, comment: ast.Comment):
+        line = comment.line
+        if self.issue_line == line-1:
+            self.issue_line = line
+            return
+        words = comment.text.split(' ')
+        if (len(words) > 1 and words[1] == '=' or words[0] in ['|', '\t'] or enums.Keywords.get(words[0])
+            or len(words) > 0 and words[0][-1:] == ';'):
+            self.issue(f'Возможно комментарий содержит закомментированный код.', comment)
+            self.issue_line = line
 
 
     def issue(self, msg, comment):
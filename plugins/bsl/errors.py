@@ -10,6 +10,9 @@ import os.path
 
 class DuplicateConditions(IssueCollector):
 
+    split = True
+    context = ()
+
     def __init__(self, path, src):
         self.path = path
         self.src = src
@@ -4,12 +4,16 @@
 
 import bsl.ast as ast
 from bsl.enums import Tokens
+from bsl.visitor import LOOP_DEPTH
 from typing import List
 from output.issues import Issue, Issues, Kind, Severity, Location, IssueCollector
 import os.path
 
 class UnusedVariables(IssueCollector):
 
+    split = True
+    context = ('counters',)
+
     # TODO: покрыть тестами
 
     def __init__(self, path, src):
@@ -36,10 +40,10 @@ class UnusedVariables(IssueCollector):
         if type(decl) is ast.GlobalObject:
             return
         if op := self.vars.get(decl):
-            if op != 'GetInLoop' or self.loop_level(counters) == 0:
+            if op != 'GetInLoop' or counters[LOOP_DEPTH] == 0:
                 self.vars[decl] = 'Set'
         elif op := self.params.get(decl):
-            if op != 'GetInLoop' or self.loop_level(counters) == 0:
+            if op != 'GetInLoop' or counters[LOOP_DEPTH] == 0:
                 self.params[decl] = 'Set'
         self.assign_left = None
 
@@ -47,7 +51,7 @@ class UnusedVariables(IssueCollector):
         if len(node.Tail) == 0 and node == self.assign_left:
             return
         decl = node.Head.Decl
-        op = self.loop_level(counters) > 0 and 'GetInLoop' or 'Get'
+        op = counters[LOOP_DEPTH] > 0 and 'GetInLoop' or 'Get'
         if self.vars.get(decl):
             self.vars[decl] = op
         elif self.params.get(decl):
@@ -73,9 +77,6 @@ class UnusedVariables(IssueCollector):
             if value == "Nil" or value == 'Set' and param.ByVal:
                 self.issue(f'Параметр "{param.Name}" не используется после присваивания', self.place.get(param) or param.Place)
 
-    def loop_level(self, counters):
-        return counters[ast.WhileStmt] + counters[ast.ForEachStmt] + counters[ast.ForStmt]
-
     def issue(self, msg, place):
         self.errors.append(Issue(
             Kind.CODE_SMELL,
@@ -93,6 +94,9 @@ class UnusedVariables(IssueCollector):
 
 class EmptyExcept(IssueCollector):
 
+    split = True
+    context = ()
+
     def __init__(self, path, src):
         self.path = path
         self.src = src
@@ -122,6 +126,9 @@ class EmptyExcept(IssueCollector):
 
 class Concatenation(IssueCollector):
 
+    split = True
+    context = ()
+
     def __init__(self, path, src):
         self.path = path
         self.src = src
@@ -162,6 +169,9 @@ class Concatenation(IssueCollector):
 
 class StructureConstructor(IssueCollector):
 
+    split = True
+    context = ()
+
     def __init__(self, path, src):
         self.path = path
         self.src = src
@@ -194,6 +204,9 @@ class StructureConstructor(IssueCollector):
 
 class Deprecated(IssueCollector):
 
+    split = True
+    context = ()
+
     def __init__(self, path, src):
         self.path = path
         self.src = src
@@ -3,9 +3,10 @@
 # license that can be found in the LICENSE file.
 
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Iterable, TextIO
 import output.issues
 import json
+import textwrap
 
 class Data:
     def toJSON(self):
@@ -38,25 +39,44 @@ class Issue(Data):
 class GenericIssueData(Data):
     issues: List[Issue]
 
+def fromIssue(item: output.issues.Issue) -> Issue:
+    return Issue(
+        'test',
+        'rule42',
+        item.severity.name,
+        item.kind.name,
+        Location(
+            item.message,
+            item.location.filepath,
+            Range(
+                item.location.startLine,
+                item.location.endLine,
+                item.location.startColumn,
+                item.location.endColumn
+            )
+        ),
+        item.effort
+    )
+
 def fromIssues(issues: List[output.issues.Issue]) -> GenericIssueData:
-    data = []
-    for item in issues:
-        issue = Issue(
-            'test',
-            'rule42',
-            item.severity.name,
-            item.kind.name,
-            Location(
-                item.message,
-                item.location.filepath,
-                Range(
-                    item.location.startLine,
-                    item.location.endLine,
-                    item.location.startColumn,
-                    item.location.endColumn
-                )
-            ),
-            item.effort
-        )
-        data.append(issue)
-    return GenericIssueData(data)
\ No newline at end of file
+    return GenericIssueData([fromIssue(item) for item in issues])
+
+class Writer:
+    """
+    Пишет отчет по мере поступления замечаний, не накапливая их в памяти.
+    Результат совпадает с fromIssues(issues).toJSON().
+    """
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.count = 0
+        f.write('{\n    "issues": [')
+
+    def write(self, issues: Iterable[output.issues.Issue]):
+        for item in issues:
+            self.f.write(',\n' if self.count else '\n')
+            self.f.write(textwrap.indent(fromIssue(item).toJSON(), ' ' * 8))
+            self.count += 1
+
+    def close(self):
+        self.f.write('\n    ]\n}' if self.count else ']\n}')
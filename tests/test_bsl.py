@@ -3,9 +3,26 @@
 # license that can be found in the LICENSE file.
 
 import pytest
-from bsl.parser import Parser, Error
+import pickle
+import os
+from decimal import Decimal
+from bsl.parser import Parser, Error, Lexers, Edit, tokenize, scan_comments
+from bsl.enums import Tokens, Keywords
+from bsl.visitor import Visitor, LOOP_DEPTH, TRY_DEPTH
+import bsl.ast as ast
+import bsl.fused
+import bsl.index
+import bsl.columnar
+import bsl.tokens
+import bsl.cache
 from bsl.parser import UnexpectedSyntax, UnexpectedChar, UnexpectedToken, UnknownToken
 from bsl.parser import AlreadyDeclared
+from output.timings import merge, report
+from bsl.glob import scope as global_scope
+import md.visitor
+from plugins.bsl.comments import ClosingComments, CommentedOutCode
+from plugins.bsl.warnings import UnusedVariables
+import bsl.parallel
 
 def error(src, err):
     p = Parser(src)
@@ -16,6 +33,21 @@ def error(src, err):
 def parse(src):
     Parser(src).parse()
 
+def tokens(src, lexer):
+    p = Parser(src, lexer=lexer)
+    result = []
+    while True:
+        tok = p.scan()
+        result.append((
+            tok, p.lit, p.val,
+            p.beg_pos, p.beg_line, p.beg_column,
+            p.end_pos, p.end_line, p.end_column,
+        ))
+        if tok == Tokens.EOF:
+            break
+    comments = [(c.text, c.pos, c.line, c.column) for c in p.comments.values()]
+    return result, comments
+
 class TestParser:
 
     def test_pass(self):
@@ -71,6 +103,502 @@ class TestParser:
         except UnexpectedToken as e:
             assert e.pos == 11
 
+    def test_lexers(self):
+
+        src = '\n'.join([
+            '&НаСервере',
+            'Процедура Тест(Знач П = 1.5) Экспорт // комментарий',
+            '    #Область  Тест',
+            '    Х = "стро""ка" + "начало',
+            '    |продолжение" + \'20200101\';',
+            '    Если Х <> 1 И Х <= 2 ИЛИ Х >= 3 / 4 Тогда Х = Истина КонецЕсли;',
+            '    #КонецОбласти',
+            'КонецПроцедуры //',
+        ])
+        expected, comments = tokens(src, Lexers.CHAR)
+        assert tokens(src, Lexers.TABLE) == (expected, comments)
+
+        buf = tokenize(src)
+        assert [(buf.kind(i), buf.lit(i), buf.begs[i], buf.lines[i], buf.columns[i]) for i in range(len(buf))] == \
+               [(tok, lit, beg_pos, beg_line, beg_column) for tok, lit, val, beg_pos, beg_line, beg_column, *end in expected]
+        assert [(c.text, c.pos, c.line, c.column) for c in buf.comments.values()] == comments
+
+        with pytest.raises(UnexpectedChar):
+            tokens("x = 1 $", Lexers.TABLE)
+        assert isinstance(tokenize("x = 1 $").error, UnexpectedChar)
+
+    def test_lazy_places(self):
+
+        src = '\n'.join([
+            '#Область Тест',
+            'Процедура Тест(П) // комментарий',
+            '    Х = "начало',
+            '    |конец" + П;',
+            '    #Если Сервер Тогда',
+            '    Х = 1;',
+            '    #КонецЕсли',
+            'КонецПроцедуры',
+            '#КонецОбласти // Тест',
+        ])
+
+        def places(module):
+            nodes = module.Decls + module.Decls[1].Body
+            return [(n.Place.BegPos, n.Place.BegLine, n.Place.BegColumn, n.Place.EndLine) for n in nodes]
+
+        eager = Parser(src).parse()
+        lazy = Parser(src, lazy_places=True).parse()
+        assert places(lazy) == places(eager)
+        assert [(c.text, c.line, c.column) for c in lazy.Comments.values()] == \
+               [(c.text, c.line, c.column) for c in eager.Comments.values()]
+
+    def test_expression(self):
+
+        module = Parser("var a, b; x = -a * b + 1 = 2 and not a <> b or b").parse()
+        expr = module.Body[0].Right
+        assert isinstance(expr, ast.BinaryExpr) and expr.Operator == Keywords.OR
+        left = expr.Left
+        assert left.Operator == Keywords.AND
+        assert isinstance(left.Right, ast.NotExpr) and left.Right.Expr.Operator == Tokens.NEQ
+        rel = left.Left
+        assert rel.Operator == Tokens.EQL and rel.Left.Operator == Tokens.ADD
+        mul = rel.Left.Left
+        assert mul.Operator == Tokens.MUL and isinstance(mul.Left, ast.UnaryExpr)
+        assert expr.Place.BegPos == mul.Left.Place.BegPos == 14
+
+        # длинная левосторонняя цепочка не упирается в предел рекурсии при обходе
+        src = 'var a; x = ' + ' + '.join(['a'] * 5000)
+        Parser(src).parse().visit(Visitor([]))
+
+    def test_visitor(self):
+
+        class Idents:
+            def __init__(self):
+                self.seen = []
+            def visit_IdentExpr(self, node, stack, counters):
+                self.seen.append((node.Head.Name, len(stack), counters[ast.MethodDecl.KindId]))
+
+        module = Parser('Процедура А(П)\n    П = П;\nКонецПроцедуры\nА(1);').parse()
+        for _ in range(2):
+            plugin = Idents()
+            visitor = Visitor([plugin])
+            module.visit(visitor)
+            assert plugin.seen == [('П', 3, 1), ('П', 3, 1), ('А', 2, 0)]
+            assert visitor.stack == [] and visitor.hooks['visit_IdentExpr'] == [plugin.visit_IdentExpr]
+            fused_plugin = Idents()
+            bsl.fused.visit(module, [fused_plugin])
+            assert fused_plugin.seen == plugin.seen
+
+        class Depths(Idents):
+            def visit_IdentExpr(self, node, stack, counters):
+                self.seen.append((node.Head.Name, counters[LOOP_DEPTH], counters[TRY_DEPTH]))
+
+        module = Parser('\n'.join([
+            'Перем А;',
+            'Пока А Цикл',
+            '    Попытка',
+            '        Для Каждого Б Из А Цикл В = Б; КонецЦикла;',
+            '    Исключение',
+            '        Г = А;',
+            '    КонецПопытки;',
+            'КонецЦикла;',
+        ])).parse()
+        expected = [('А', 1, 0), ('Б', 2, 1), ('А', 2, 1), ('В', 2, 1), ('Б', 2, 1), ('Г', 1, 0), ('А', 1, 0)]
+        plugin = Depths()
+        module.visit(Visitor([plugin]))
+        assert plugin.seen == expected
+        fused_plugin = Depths()
+        bsl.fused.visit(module, [fused_plugin])
+        assert fused_plugin.seen == expected
+
+        # хуки, которые читают счетчики не по имени параметра
+        class Helper(Idents):
+            def visit_IdentExpr(self, node, stack, counters):
+                self.depth(node, counters)
+            def depth(self, node, counters):
+                self.seen.append((node.Head.Name, counters[LOOP_DEPTH], counters[TRY_DEPTH]))
+
+        class Forward(Idents):
+            def visit_IdentExpr(self, node, *args):
+                self.seen.append((node.Head.Name, args[-1][LOOP_DEPTH], args[-1][TRY_DEPTH]))
+
+        class Locals(Idents):
+            param = 'counters'
+            def visit_IdentExpr(self, node, stack, counters):
+                depths = locals()[self.param]
+                self.seen.append((node.Head.Name, depths[LOOP_DEPTH], depths[TRY_DEPTH]))
+
+        for plugin_class in (Helper, Forward, Locals):
+            fused_plugin = plugin_class()
+            bsl.fused.visit(module, [fused_plugin])
+            assert fused_plugin.seen == expected, plugin_class.__name__
+        assert bsl.fused.uses(Idents, 'visit_IdentExpr', 'stack')
+        assert not bsl.fused.uses(Depths, 'visit_IdentExpr', 'stack')
+        assert bsl.fused.uses(Helper, 'visit_IdentExpr', 'counters')
+
+        # объявление плагина точнее проверки кода
+        class Declared(Forward):
+            context = ('counters',)
+        assert bsl.fused.uses(Declared, 'visit_IdentExpr', 'counters')
+        assert not bsl.fused.uses(Declared, 'visit_IdentExpr', 'stack')
+        fused_plugin = Declared()
+        bsl.fused.visit(module, [fused_plugin])
+        assert fused_plugin.seen == expected
+
+    def test_timings(self):
+
+        class Idents:
+            def visit_IdentExpr(self, node, stack, counters):
+                pass
+            def leave_MethodDecl(self, node, stack, counters):
+                pass
+
+        module = Parser('Процедура А(П)\n    П = П;\nКонецПроцедуры\nА(1);').parse()
+        timings, fused_timings = {}, {}
+        module.visit(Visitor([Idents()], timings))
+        bsl.fused.visit(module, [Idents()], fused_timings)
+        for result in (timings, fused_timings):
+            assert sorted((key, calls) for key, (calls, ns) in result.items()) == \
+                [(('Idents', 'leave_MethodDecl'), 1), (('Idents', 'visit_IdentExpr'), 3)]
+        total = merge(merge({}, timings), fused_timings)
+        assert total['Idents', 'visit_IdentExpr'][0] == 6
+        assert 'Idents.visit_IdentExpr' in report(total)
+
+    def test_index(self):
+
+        src = 'Процедура А()\n    Если Истина Тогда С = Новый Структура("а", Новый Массив) КонецЕсли;\nКонецПроцедуры'
+        module = Parser(src, node_index=True).parse()
+        index = module.Index
+        first, second = index.of(ast.NewExpr)
+        assert first.Name == 'Структура' and second.Name == 'Массив'
+        assert index.parent(second) is first and index.parent(module) is None
+        assert [type(node) for node in index.ancestors(first)] == \
+            [ast.AssignStmt, ast.IfStmt, ast.MethodDecl, ast.Module]
+        assert index.of(ast.ExceptStmt) == []
+
+        class News:
+            def __init__(self):
+                self.names = []
+            def query(self, index):
+                self.names.extend(node.Name for node in index.of(ast.NewExpr))
+
+        module = Parser(src).parse()
+        plugin = News()
+        bsl.index.run(module, [plugin])
+        assert plugin.names == ['Структура', 'Массив'] and module.Index is not None
+
+    def test_columnar(self):
+
+        src = 'Перем А; А = "а" + А; А = А + 1; А = Новый Структура("а", 1, 2);'
+        module = Parser(src).parse()
+        columns = bsl.columnar.convert(module)
+        assert columns.kind(0) is ast.Module and columns.parents[0] == -1
+        assert [columns.kind(i) for i in columns.children(0)] == \
+            [ast.VarModListDecl, ast.AssignStmt, ast.AssignStmt, ast.AssignStmt]
+        adds = columns.select(ast.BinaryExpr, Tokens.ADD)
+        assert len(adds) == 2
+        concat, = columns.with_child(adds, ast.StringExpr)
+        assert columns.operator(concat) == Tokens.ADD
+        assert src[columns.begs[concat]:columns.ends[concat]] == '"а" + А'
+        new, = columns.named(columns.select(ast.NewExpr), 'структура')
+        assert columns.name(new) == 'Структура'
+        assert list(columns.inside(columns.select(ast.StringExpr), ast.NewExpr)) == [new + 1]
+
+    def test_fused_pruning(self):
+
+        class Methods:
+            def visit_MethodDecl(self, node, stack, counters):
+                pass
+
+        class Literals(Methods):
+            interests = (bsl.fused.EXPRESSIONS,)
+            def __init__(self):
+                self.seen = []
+            def visit_BasicLitExpr(self, node, stack, counters):
+                self.seen.append(node.Value)
+
+        table = Visitor.hook_table((Methods,))
+        needed = bsl.fused.needed_types((Methods,), table)
+        assert {'Module', 'MethodDecl'} <= needed and not needed & {'IfStmt', 'IdentExpr', 'BasicLitExpr'}
+        table = Visitor.hook_table((Literals,))
+        assert 'IfStmt' in bsl.fused.needed_types((Literals,), table)
+
+        module = Parser('Процедура А()\n    Если 1 Тогда Б(2, "с") КонецЕсли;\nКонецПроцедуры').parse()
+        plugin = Literals()
+        bsl.fused.visit(module, [plugin])
+        assert plugin.seen == [1, 2, 'с']
+
+    def test_reparse(self):
+
+        src = '\n'.join([
+            'Перем М;',
+            'Процедура А()',
+            '    М = 1;',
+            'КонецПроцедуры',
+            'Процедура Б() // Б',
+            '    А();',
+            'КонецПроцедуры // Б()',
+            '',
+        ])
+        old = Parser(src).parse()
+
+        pos = src.index('М = 1')
+        edit = Edit(pos, pos, 'Х = 2;\n    ')
+        new_src = src[:pos] + edit.text + src[pos:]
+        module = Parser(new_src).reparse(old, edit)
+        full = Parser(new_src).parse()
+        assert module.Decls[0] is old.Decls[0]
+        assert len(module.Decls[1].Body) == 2
+        place, full_place = module.Decls[2].Place, full.Decls[2].Place
+        assert (place.BegPos, place.EndPos, place.BegLine, place.EndLine) == \
+               (full_place.BegPos, full_place.EndPos, full_place.BegLine, full_place.EndLine)
+        assert sorted(module.Comments) == sorted(full.Comments) == [6, 8]
+
+        # правка объявлений уровня модуля ведет к полному разбору
+        edit = Edit(src.index(';'), src.index(';'), ', Н')
+        module = Parser(src.replace('Перем М;', 'Перем М, Н;')).reparse(old, edit)
+        assert len(module.Decls[0].List) == 2
+
+    def test_idents(self):
+
+        p = Parser('еСлИ Знач.Если ТОГДА КонецЕсли; Перем')
+        tokens = []
+        while p.scan() != Tokens.EOF:
+            tokens.append(p.tok)
+        assert tokens == [Keywords.IF, Keywords.VAL, Tokens.PERIOD, Keywords.IF, Keywords.THEN,
+                          Keywords.ENDIF, Tokens.SEMICOLON, Keywords.VAR]
+        module = Parser('А = 1; Б = 2; А.Поле = 1; Б.Поле = 2;').parse()
+        assert module.Body[2].Left.Tail[0].Name is module.Body[3].Left.Tail[0].Name
+
+    def test_literals(self):
+
+        module = Parser('x = "а""б" + 1.50 + Истина + "в\n|г";').parse()
+        expr = module.Body[0].Right
+        string = expr.Left.Left.Left.List[0]
+        assert string.Lit == '"а""б"' and string.Value == 'а"б'
+        assert expr.Left.Left.Right.Value == Decimal('1.50')
+        assert expr.Left.Right.Value is True
+        assert [part.Value for part in expr.Right.List] == ['в', 'г']
+
+    def test_shared_scopes(self):
+
+        conf = ast.Scope(global_scope)
+        conf.Methods['общий'] = ast.Item('Общий')
+        local = ast.Scope(conf)
+        local.Vars['реквизит'] = ast.Item('Реквизит')
+        modules = [
+            md.visitor.ModuleFile(md.visitor.ModuleKinds.ObjectModule, 'ObjectModule.bsl', local),
+            md.visitor.ModuleFile(md.visitor.ModuleKinds.ManagerModule, 'ManagerModule.bsl', conf),
+        ]
+        scopes = [conf, global_scope]
+        full = len(pickle.dumps(modules[0]))
+        md.visitor.share(scopes)
+        try:
+            data = pickle.dumps(modules[0])
+            assert len(data) * 100 < full
+            module = pickle.loads(data)
+            assert module.path == 'ObjectModule.bsl' and module.scope is not local
+            assert list(module.scope.Vars) == ['реквизит'] and module.scope.Outer is conf
+            assert pickle.loads(pickle.dumps(modules[1])).scope is conf
+        finally:
+            md.visitor.share([])
+
+    def test_ast_cache(self, tmp_path):
+
+        src = '\n'.join([
+            'Перем М Экспорт;',
+            '&НаСервере',
+            'Функция Ф(П, Знач Б = 1.5) Экспорт // Ф',
+            '    Х = "начало',
+            '    |конец" + П * 2 - Б;',
+            '    #Если Сервер Тогда',
+            '    Для Каждого Э Из Новый Массив(1, , 2) Цикл Х = ?(Э = Неопределено, М, Э[0].Поле); КонецЦикла;',
+            '    #КонецЕсли',
+            '    Неизвестная();',
+            '    Возврат Истина;',
+            'КонецФункции',
+            'Сообщить(Ф(1) + 1 + 2);',
+        ])
+
+        def places(module):
+            return [
+                (type(n).__name__, n.Place.BegPos, n.Place.EndPos, n.Place.BegLine, n.Place.EndLine, n.Place.BegColumn, n.Place.EndColumn)
+                for cls, nodes in bsl.index.build(module).Nodes.items() if cls is not ast.Module for n in nodes
+            ]
+
+        cache = bsl.cache.enable(str(tmp_path))
+        try:
+            for lazy in False, True:
+                parser = Parser(src, lazy_places=lazy)
+                module = parser.parse()
+                cached_parser = Parser(src, lazy_places=lazy)
+                cached = cached_parser.parse()
+                assert places(cached) == places(module)
+                assert cached_parser.errors == parser.errors and len(parser.errors) == 1
+                assert sorted(cached.Comments) == sorted(module.Comments) == [3]
+                assert [item.Name for item in cached.Interface] == ['М', 'Ф']
+                method = cached.Decls[1]
+                assert cached.Scope.Vars['м'].Decl is cached.Decls[0].List[0]
+                assert cached.Scope.Methods['ф'].Decl is method.Sign
+                assert method.Sign.Params[1].Value.Value == Decimal('1.5')
+                assert method.Body[0].Left.Head.Decl is method.Auto[0]
+                assert cached.Body[0].Ident.Head is global_scope.Methods['сообщить']
+            assert (cache.hits, cache.misses) == (2, 2)
+
+            # отпечаток внешней области видимости входит в ключ
+            conf = ast.Scope(global_scope)
+            Parser(src, conf).parse()
+            conf.Vars['м2'] = ast.Item('М2')
+            Parser(src, conf).parse()
+            Parser(src, conf).parse()
+            assert (cache.hits, cache.misses) == (3, 4)
+
+            # вытесняются файлы, к которым дольше всего не обращались
+            files = sorted(tmp_path.iterdir(), key=lambda path: path.stat().st_mtime)
+            assert len(files) == 4
+            for age, path in enumerate(reversed(files)):
+                os.utime(path, (0, 1000 - age))
+            cache.limit = sum(path.stat().st_size for path in files[2:]) / bsl.cache.EVICTION_TARGET + 1
+            cache.evict()
+            assert sorted(tmp_path.iterdir()) == sorted(files[2:])
+        finally:
+            bsl.cache.disable()
+
+    def test_parse_stream(self):
+
+        class Events:
+            def __init__(self):
+                self.events = []
+            def visit_MethodDecl(self, node, stack, counters):
+                self.events.append(('visit', node.Sign.Name, len(stack)))
+            def leave_MethodDecl(self, node, stack, counters):
+                self.events.append(('leave', node.Sign.Name, len(stack)))
+            def visit_IdentExpr(self, node, stack, counters):
+                self.events.append(('ident', node.Head.Name, type(node.Head.Decl).__name__, len(stack)))
+            def leave_Module(self, node, stack, counters):
+                self.events.append(('module', len(node.Decls), len(node.Comments)))
+
+        # вызов Б() до объявления Б и вызов необъявленного метода В()
+        src = 'Процедура А(П)\n    П = Б();\nКонецПроцедуры // А()\nФункция Б()\nКонецФункции\nА(2);\nВ();'
+        for lazy in (False, True):
+            full = Events()
+            Parser(src, lazy_places=lazy).parse().visit(Visitor([full]))
+            stream = Events()
+            module = Parser(src, lazy_places=lazy).parse_stream([stream])
+            assert stream.events[:-1] == full.events[:-1]
+            assert stream.events[-1] == ('module', 0, 1) and module.Decls == []
+
+    def test_token_plugins(self):
+
+        class Casing:
+            def __init__(self):
+                self.lower = []
+                self.comments = []
+            def visit_Token(self, tok, lit, pos, line, column):
+                if isinstance(tok, Keywords) and lit.islower():
+                    self.lower.append((lit, line, column))
+            def visit_Comment(self, comment):
+                self.comments.append(comment.text)
+
+        class Mixed(Casing):
+            def visit_MethodDecl(self, node, stack, counters):
+                pass
+
+        assert bsl.tokens.is_token_level(Casing()) and not bsl.tokens.is_token_level(Mixed())
+
+        src = '//А = 1;\nПроцедура А()\n    если Б = Тогда\nКонецПроцедуры // А()\n'
+        with pytest.raises(UnexpectedToken):
+            Parser(src).parse()
+        plugin = Casing()
+        bsl.tokens.run(src, [plugin])
+        assert plugin.lower == [('если', 3, 4)]
+        assert plugin.comments == ['А = 1;', ' А()']
+
+        plugin = Casing()
+        bsl.tokens.run(src, [plugin], {})
+        assert plugin.lower == [('если', 3, 4)] and plugin.comments == []
+
+        src = 'Процедура А()\n    //Х = 1;\n    //Б();\nКонецПроцедуры\n'
+        runs = [
+            lambda plugin: Parser(src).parse().visit(Visitor([plugin])),
+            lambda plugin: bsl.fused.visit(Parser(src).parse(), [plugin]),
+            lambda plugin: Parser(src).parse_stream([plugin]),
+            lambda plugin: bsl.tokens.run(src, [plugin]),
+        ]
+        for run in runs:
+            plugin = CommentedOutCode('m.bsl', src)
+            run(plugin)
+            assert [issue.location.startLine for issue in plugin.close().items] == [2]
+
+    def test_parse_interface(self):
+
+        src = '\n'.join([
+            'Перем А Экспорт, Б;',
+            '#Область Интерфейс',
+            '#Если Сервер Тогда',
+            'Функция В() Экспорт',
+            '    Возврат "КонецФункции"; // КонецФункции',
+            'КонецФункции',
+            '#КонецЕсли',
+            'Процедура Г()',
+            '    Объект.КонецПроцедуры = НеизвестныйМетод();',
+            'КонецПроцедуры',
+            '#КонецОбласти',
+            'Процедура Д(Знач П = 1) Экспорт',
+            'КонецПроцедуры',
+            'В();',
+        ])
+        items = Parser(src).parse_interface()
+        assert [item.Name for item in items] == [item.Name for item in Parser(src).parse().Interface] == ['А', 'В', 'Д']
+        assert isinstance(items[0].Decl, ast.VarModDecl)
+        assert items[2].Decl.Params[0].ByVal
+
+    def test_parse_parallel(self):
+
+        src = '\n'.join([
+            'Перем М;',
+            '#Область Служебные',
+            'Процедура А() // А',
+            '    Х = 1; //Х = 2;',
+            '    Б();',
+            'КонецПроцедуры // А()',
+            '//М = 1;',
+            'Функция Б(П1, // П1',
+            '          П2 = "//")',
+            '    #Область Тело',
+            '    Возврат М;',
+            '    #КонецОбласти // Тело',
+            'КонецФункции // Б',
+            '#КонецОбласти',
+            'Процедура В()',
+            '    Н = 1;',
+            'КонецПроцедуры',
+            'М = 2; // М',
+            '',
+        ])
+        comments = [(c.text, c.pos, c.line, c.column) for c in tokenize(src).comments.values()]
+        assert [(c.text, c.pos, c.line, c.column) for c in scan_comments(src).values()] == comments
+        classes = (ClosingComments, CommentedOutCode, UnusedVariables)
+        assert bsl.parallel.splittable(classes)
+
+        def issues(plugin):
+            return [(issue.message, issue.location.startLine) for issue in plugin.close().items]
+
+        serial = [cls('m.bsl', src) for cls in classes]
+        Parser(src, lazy_places=True).parse().visit(Visitor(serial))
+        expected = [issues(plugin) for plugin in serial]
+        assert all(expected)
+        for count in 1, 2, 3, 5:
+            parts = []
+            for part in range(count):
+                plugins = [cls('m.bsl', src) for cls in classes]
+                module = bsl.parallel.parse(src, None, part, count)
+                assert all(isinstance(decl, ast.MethodDecl) for decl in module.Decls) or part == 0
+                module.visit(Visitor(plugins))
+                parts.append([issues(plugin) for plugin in plugins])
+            assert [sorted(result) for result in bsl.parallel.merge(parts)] == [sorted(result) for result in expected]
+        # результат плагина, не полученный в какой-либо части, отбрасывается
+        assert bsl.parallel.merge([[[1], [2]], [None, [3]]]) == [[2, 3]]
+
     def test_error(self):
 
         error("x = x + 1", Error('Undeclared identifier "x"', 4, 1))
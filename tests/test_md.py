@@ -0,0 +1,104 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+from bsl.parser import Parser
+import bsl.ast as ast
+from bsl.glob import scope as global_scope
+from output.issues import Issue, Kind, Severity, Location
+from plugins.bsl.comments import CommentedOutCode
+import md.visitor
+import md.schedule
+import md.manifest
+
+class TestMd:
+
+    def test_schedule(self, tmp_path):
+
+        # пока пул занят, пакеты ждут в очереди и передаются по убыванию стоимости
+        submitted = []
+        pending = md.schedule.Queue(submitted.append, 1)
+        for cost, name in (0.1, 'c'), (0.2, 'd'), (5.0, 'a'), (0.2, 'e'):
+            pending.put(md.schedule.Batch(cost, [name]))
+        for _ in range(4):
+            pending.done()
+        assert [batch.modules[0] for batch in submitted] == ['c', 'a', 'd', 'e']
+        costs = {'a.bsl': 5.0, 'b.bsl': 0.01}
+        costs_path = str(tmp_path / 'costs.json')
+        assert md.schedule.load(costs_path) == {}
+        md.schedule.save(costs_path, costs)
+        assert md.schedule.load(costs_path) == costs
+
+    def test_pipeline(self):
+
+        submitted = []
+        visitor = md.visitor.Visitor([], submit=submitted.append)
+        conf = visitor.open_scope()
+        held = md.visitor.ModuleFile(md.visitor.ModuleKinds.CommonModule, 'Module.bsl', conf)
+        visitor.add_module(held)
+        assert submitted == [] and visitor.shared is None
+        visitor.share_scope()
+        assert submitted == [held] and visitor.shared == [conf, global_scope]
+        ready = md.visitor.ModuleFile(md.visitor.ModuleKinds.ObjectModule, 'ObjectModule.bsl', visitor.open_scope())
+        visitor.add_module(ready)
+        assert submitted == [held, ready] and visitor.modules == [held, ready]
+
+        batches = []
+        batcher = md.schedule.Batcher({'big.bsl': 1.0, 'a.bsl': 0.02, 'b.bsl': 0.02}, batches.append, 0.03)
+        for name in 'a', 'big', 'b', 'c':
+            batcher.add(md.visitor.ModuleFile(md.visitor.ModuleKinds.CommonModule, f'{name}.bsl'))
+        batcher.flush()
+        assert [[module.path for module in batch.modules] for batch in batches] == [['big.bsl'], ['a.bsl', 'b.bsl'], ['c.bsl']]
+
+        # дорогой модуль передается частями (см. bsl.parallel), в прогрессе он учитывается один раз
+        batches = []
+        batcher = md.schedule.Batcher({'big.bsl': 1.2}, batches.append, 0.03, split=4)
+        batcher.add(md.visitor.ModuleFile(md.visitor.ModuleKinds.CommonModule, 'big.bsl'))
+        assert [batch.part for batch in batches] == [(0, 2), (1, 2)]
+        assert [md.schedule.counted(batch) for batch in batches] == [1, 0]
+
+    def test_manifest(self, tmp_path):
+
+        conf = ast.Scope(global_scope)
+        conf.Methods['метод'] = Parser('Процедура Метод(П) Экспорт\nКонецПроцедуры').parse_interface()[0]
+        document = ast.Scope(conf)
+        path = tmp_path / 'ObjectModule.bsl'
+        path.write_text('//А = 1;\n', encoding='utf-8')
+        module = md.visitor.ModuleFile(md.visitor.ModuleKinds.ObjectModule, str(path), ast.Scope(document))
+        issue = Issue(Kind.CODE_SMELL, Severity.MINOR, 'Сообщение', 1, Location(str(path), 1, 1, 0, 5))
+        manifest_path = str(tmp_path / 'manifest.json')
+
+        manifest = md.manifest.Manifest(manifest_path, '1')
+        assert manifest.lookup(module) is None
+        manifest.update(module.path, [issue])
+        manifest.save()
+        assert md.manifest.Manifest(manifest_path, '1').lookup(module) == [issue]
+        assert md.manifest.Manifest(manifest_path, '2').lookup(module) is None
+        assert md.manifest.Manifest(manifest_path, '1', full=True).lookup(module) is None
+
+        # изменение реквизита документа или сигнатуры метода в общей области инвалидирует модуль
+        document.Vars['реквизит'] = ast.Item('Реквизит')
+        assert md.manifest.Manifest(manifest_path, '1').lookup(module) is None
+        del document.Vars['реквизит']
+        conf.Methods['метод'] = Parser('Процедура Метод(П, Знач Б = 1) Экспорт\nКонецПроцедуры').parse_interface()[0]
+        assert md.manifest.Manifest(manifest_path, '1').lookup(module) is None
+        conf.Methods['метод'] = Parser('\nПроцедура Метод(П) Экспорт\n    А = 1;\nКонецПроцедуры').parse_interface()[0]
+        assert md.manifest.Manifest(manifest_path, '1').lookup(module) == [issue]
+        path.write_text('//Б = 1;\n', encoding='utf-8')
+        assert md.manifest.Manifest(manifest_path, '1').lookup(module) is None
+
+        # изменение исходного текста анализатора (не модуля плагина) меняет версию
+        root = tmp_path / 'src'
+        for name in md.manifest.SOURCES:
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_bytes(open(os.path.join(md.manifest.ROOT, name), 'rb').read())
+        version = md.manifest.version((CommentedOutCode,), str(root))
+        assert version == md.manifest.version((CommentedOutCode,))
+        manifest = md.manifest.Manifest(manifest_path, version)
+        manifest.update(module.path, [issue])
+        manifest.save()
+        with open(root / 'bsl' / 'visitor.py', 'a', encoding='utf-8') as f:
+            f.write('\n')
+        changed = md.manifest.version((CommentedOutCode,), str(root))
+        assert changed != version and md.manifest.Manifest(manifest_path, changed).lookup(module) is None
@@ -0,0 +1,17 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import io
+from output.progress import Progress
+
+class TestOutput:
+
+    def test_progress(self):
+
+        stream = io.StringIO()
+        progress = Progress(3, 4.0, stream)
+        assert progress.line(1.0) == '0/3 modules (0%), elapsed 1 s, ETA ?'
+        progress.advance(2, 1.0)
+        assert progress.line(10.0) == '2/3 modules (25%), elapsed 10 s, ETA 30 s'
+        assert stream.getvalue().endswith('\r')
@@ -0,0 +1,24 @@
+# Copyright 2019 Tsukanov Alexander. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import io
+from output.issues import Issue, Kind, Severity, Location
+import reports.sonar as sonar
+
+class TestReports:
+
+    def test_report_stream(self):
+
+        issues = [
+            Issue(Kind.CODE_SMELL, Severity.MINOR, 'Сообщение\n"1"', 1, Location('a.bsl', 1, 1, 0, 5)),
+            Issue(Kind.BUG, Severity.MAJOR, 'Сообщение 2', 2, Location('b.bsl', 3, 4, 1, 2)),
+        ]
+        for items in [], issues:
+            f = io.StringIO()
+            writer = sonar.Writer(f)
+            for item in items:
+                writer.write([item])
+            writer.close()
+            assert f.getvalue() == sonar.fromIssues(items).toJSON()
+            assert writer.count == len(items)